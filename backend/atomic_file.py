@@ -0,0 +1,22 @@
+"""Crash-safe file replacement."""
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    """Open a temp file next to ``path`` and rename it over ``path`` once the
+    block succeeds, so readers see the old or the new file, never a torn one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,109 @@
+"""Revision tracking for delta sync of the progress document.
+
+Every change to a user bumps the document's top-level ``revision``. The
+change log in ``progress["change_log"]`` records, for each row it saw change
+(``lessons``, ``question_states`` and ``daily_activity`` entries), the last
+revision that touched it::
+
+    {"base": 40, "keys": {"question_states": {"ex_1_1_3": 42}, ...}}
+
+Changes after ``base`` are all in ``keys``, so a client at revision
+``since >= base`` only needs the rows with a later revision. Older clients
+get the whole document. The log lives in the progress document so it
+survives restarts and is shared by workers in SHARED_STATE mode (SqliteStore
+keeps it in its own table rather than in ``progress_extra``); it is trimmed
+oldest first to ``max_keys`` rows.
+"""
+from compact_state import progress_for_api
+from progress_store import CHANGE_LOG_KEY, ROW_SECTIONS
+
+
+def record_changes(progress, revision, changes, max_keys):
+    """Note that ``revision`` touched ``changes`` (None: everything)."""
+    log = progress.get(CHANGE_LOG_KEY)
+    if changes is None or log is None:
+        # Unknown history: only clients already at this revision can follow.
+        log = progress[CHANGE_LOG_KEY] = {
+            "base": revision if changes is None else revision - 1,
+            "keys": {},
+        }
+        if changes is None:
+            return
+    keys = log["keys"]
+    for section, key in changes:
+        if section in ROW_SECTIONS:
+            keys.setdefault(section, {})[key] = revision
+
+    total = sum(len(section_keys) for section_keys in keys.values())
+    if total <= max_keys:
+        return
+    # Trim to three quarters so trimming is rare.
+    entries = sorted(
+        (rev, section, key)
+        for section, section_keys in keys.items()
+        for key, rev in section_keys.items()
+    )
+    for rev, section, key in entries[: total - max_keys * 3 // 4]:
+        del keys[section][key]
+        log["base"] = max(log["base"], rev)
+
+
+def changed_since(progress, since, revision):
+    """``{section: [keys]}`` changed after ``since``, or None when the log no
+    longer covers it and the whole document must be sent."""
+    if since > revision:
+        return None
+    if since == revision:
+        return {}
+    log = progress.get(CHANGE_LOG_KEY)
+    if log is None or since < log["base"]:
+        return None
+    return {
+        section: [key for key, rev in section_keys.items() if rev > since]
+        for section, section_keys in log["keys"].items()
+    }
+
+
+def needs_question_states(progress, since, revision):
+    """Whether the delta for ``since`` includes question_states rows."""
+    changed = changed_since(progress, since, revision)
+    return changed is None or bool(changed.get("question_states"))
+
+
+def progress_document(progress, revision):
+    """The full progress document for the API, with its revision."""
+    document = {
+        key: value
+        for key, value in progress_for_api(progress).items()
+        if key != CHANGE_LOG_KEY
+    }
+    document["revision"] = revision
+    return document
+
+
+def progress_delta(progress, since, revision):
+    """Rows changed after ``since`` plus the small non-row sections, or the
+    full document (``"full": True``) when the log cannot answer."""
+    changed = changed_since(progress, since, revision)
+    if changed is None:
+        document = progress_document(progress, revision)
+        document["full"] = True
+        return document
+
+    delta = {"revision": revision, "since": since, "full": False, "changes": {}}
+    if since == revision:
+        return delta
+    for section, keys in changed.items():
+        if not keys:
+            continue
+        rows = progress.get(section, {})
+        values = {}
+        for key in keys:
+            value = rows.get(key)
+            # None marks a row that was removed.
+            values[key] = dict(value) if value is not None else None
+        delta["changes"][section] = values
+    for key, value in progress.items():
+        if key not in ROW_SECTIONS and key != CHANGE_LOG_KEY:
+            delta[key] = value
+    return delta
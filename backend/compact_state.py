@@ -0,0 +1,354 @@
+"""Compact in-memory and on-disk encoding of per-user progress.
+
+``question_states`` is held as parallel packed arrays keyed by the question's
+stable ordinal (see ``question_ordinals.json`` written by
+generate_question_bank.py) instead of one dict per question. It still behaves
+as a mutable mapping of question ID -> state dict, so handlers are unchanged;
+``progress_for_api`` turns it back into plain dicts for responses.
+
+Old ``daily_activity`` days are rolled up into monthly totals under
+``activity_rollup`` so the per-day map stays bounded.
+"""
+import base64
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime, timedelta
+
+ORDINALS_FILE = "question_ordinals.json"
+PACKED_MARKER = "__compact__"
+
+# column -> array typecode. Every column stores 0 for "unset": ef is kept in
+# thousandths, reps/interval are offset by one and due is epoch seconds.
+COLUMNS = {
+    "correct": "I",
+    "wrong": "I",
+    "ef": "I",
+    "reps": "I",
+    "interval": "I",
+    "due": "q",
+}
+
+
+class CompactStateError(RuntimeError):
+    pass
+
+
+class QuestionOrdinals:
+    """Append-only question ID <-> ordinal registry."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.index = {qid: ordinal for ordinal, qid in enumerate(ids)}
+
+    def get(self, question_id):
+        return self.index.get(question_id)
+
+    def id_of(self, ordinal):
+        return self.ids[ordinal]
+
+
+def load_question_ordinals(data_dir):
+    path = os.path.join(data_dir, ORDINALS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return QuestionOrdinals(json.load(f)["ids"])
+
+
+def _encode(column, value):
+    if value is None:
+        return 0
+    if column == "ef":
+        return max(1, round(value * 1000))
+    if column in ("reps", "interval"):
+        return value + 1
+    if column == "due":
+        return int(datetime.fromisoformat(value).timestamp())
+    return value
+
+
+def _decode(column, raw):
+    if column in ("correct", "wrong"):
+        return raw
+    if raw == 0:
+        return None
+    if column == "ef":
+        return raw / 1000
+    if column in ("reps", "interval"):
+        return raw - 1
+    return datetime.fromtimestamp(raw).isoformat(timespec="seconds")
+
+
+class _StateView(MutableMapping):
+    """One question's state, reading and writing the owner's arrays."""
+
+    __slots__ = ("_owner", "_ordinal")
+
+    def __init__(self, owner, ordinal):
+        self._owner = owner
+        self._ordinal = ordinal
+
+    def _extra(self, create=False):
+        if create:
+            return self._owner._slot_extra.setdefault(self._ordinal, {})
+        return self._owner._slot_extra.get(self._ordinal, {})
+
+    def __getitem__(self, key):
+        if key in COLUMNS:
+            value = _decode(key, self._owner._column(key, self._ordinal))
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self._extra()[key]
+
+    def __setitem__(self, key, value):
+        if key in COLUMNS:
+            self._owner._set_column(key, self._ordinal, _encode(key, value))
+        else:
+            self._extra(create=True)[key] = value
+
+    def __delitem__(self, key):
+        if key in ("correct", "wrong"):
+            self._owner._set_column(key, self._ordinal, 0)
+        elif key in COLUMNS:
+            if key not in self:
+                raise KeyError(key)
+            self._owner._set_column(key, self._ordinal, 0)
+        else:
+            del self._extra()[key]
+
+    def __iter__(self):
+        for key in COLUMNS:
+            if key in ("correct", "wrong") or self._owner._column(key, self._ordinal):
+                yield key
+        yield from self._extra()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactQuestionStates(MutableMapping):
+    """question_states as sorted ordinals plus one packed array per field.
+
+    IDs missing from the ordinal registry fall back to a plain dict.
+    """
+
+    def __init__(self, ordinals):
+        self.ordinals = ordinals
+        self._keys = array("I")
+        self._columns = {name: array(code) for name, code in COLUMNS.items()}
+        self._slot_extra = {}
+        self._unmapped = {}
+
+    def _slot(self, ordinal):
+        slot = bisect_left(self._keys, ordinal)
+        if slot < len(self._keys) and self._keys[slot] == ordinal:
+            return slot
+        return None
+
+    def _column(self, name, ordinal):
+        return self._columns[name][self._slot(ordinal)]
+
+    def _set_column(self, name, ordinal, raw):
+        self._columns[name][self._slot(ordinal)] = raw
+
+    def __getitem__(self, question_id):
+        ordinal = self.ordinals.get(question_id)
+        if ordinal is None:
+            return self._unmapped[question_id]
+        if self._slot(ordinal) is None:
+            raise KeyError(question_id)
+        return _StateView(self, ordinal)
+
+    def __setitem__(self, question_id, state):
+        ordinal = self.ordinals.get(question_id)
+        if ordinal is None:
+            self._unmapped[question_id] = dict(state)
+            return
+        slot = self._slot(ordinal)
+        if slot is None:
+            slot = bisect_left(self._keys, ordinal)
+            self._keys.insert(slot, ordinal)
+            for column in self._columns.values():
+                column.insert(slot, 0)
+        else:
+            for column in self._columns.values():
+                column[slot] = 0
+        self._slot_extra.pop(ordinal, None)
+        view = _StateView(self, ordinal)
+        for key, value in state.items():
+            view[key] = value
+
+    def __delitem__(self, question_id):
+        ordinal = self.ordinals.get(question_id)
+        if ordinal is None:
+            del self._unmapped[question_id]
+            return
+        slot = self._slot(ordinal)
+        if slot is None:
+            raise KeyError(question_id)
+        del self._keys[slot]
+        for column in self._columns.values():
+            del column[slot]
+        self._slot_extra.pop(ordinal, None)
+
+    def __contains__(self, question_id):
+        ordinal = self.ordinals.get(question_id)
+        if ordinal is None:
+            return question_id in self._unmapped
+        return self._slot(ordinal) is not None
+
+    def __iter__(self):
+        for ordinal in self._keys:
+            yield self.ordinals.id_of(ordinal)
+        yield from self._unmapped
+
+    def __len__(self):
+        return len(self._keys) + len(self._unmapped)
+
+    def __repr__(self):
+        return f"CompactQuestionStates({len(self)} entries)"
+
+    def approx_bytes(self):
+        extra = len(self._slot_extra) + len(self._unmapped)
+        return 32 * len(self._keys) + 200 * extra
+
+    def pack(self):
+        """JSON-serializable form: base64 little-endian arrays."""
+
+        def b64(arr):
+            if sys.byteorder == "big":
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            return base64.b64encode(arr.tobytes()).decode("ascii")
+
+        packed = {PACKED_MARKER: 1, "ordinals": b64(self._keys)}
+        for name, column in self._columns.items():
+            packed[name] = b64(column)
+        if self._slot_extra:
+            packed["slot_extra"] = {str(k): v for k, v in self._slot_extra.items()}
+        if self._unmapped:
+            packed["unmapped"] = self._unmapped
+        return packed
+
+    @classmethod
+    def unpack(cls, packed, ordinals):
+        def unb64(code, text):
+            arr = array(code, base64.b64decode(text))
+            if sys.byteorder == "big":
+                arr.byteswap()
+            return arr
+
+        states = cls(ordinals)
+        states._keys = unb64("I", packed["ordinals"])
+        if states._keys and states._keys[-1] >= len(ordinals.ids):
+            raise CompactStateError(
+                "Packed question states reference ordinals missing from "
+                f"{ORDINALS_FILE}; regenerate it instead of deleting it"
+            )
+        for name, code in COLUMNS.items():
+            states._columns[name] = unb64(code, packed[name])
+        states._slot_extra = {
+            int(k): v for k, v in packed.get("slot_extra", {}).items()
+        }
+        for question_id, state in packed.get("unmapped", {}).items():
+            states._restore(question_id, state)
+        return states
+
+    @classmethod
+    def from_dict(cls, states, ordinals):
+        compact = cls(ordinals)
+        for question_id, state in states.items():
+            compact._restore(question_id, state)
+        return compact
+
+    def _restore(self, question_id, state):
+        """Add a stored state, moving it into a slot if its ID now has an
+        ordinal. Counts recorded in a slot meanwhile are added to it."""
+        if self.ordinals.get(question_id) is None or question_id not in self:
+            self[question_id] = state
+            return
+        current = self[question_id]
+        for key in ("correct", "wrong"):
+            current[key] = current.get(key, 0) + state.get(key, 0)
+
+
+def is_packed(question_states):
+    return isinstance(question_states, Mapping) and PACKED_MARKER in question_states
+
+
+def compact_question_states(question_states, ordinals):
+    """Return the resident form of a stored ``question_states`` value."""
+    if isinstance(question_states, CompactQuestionStates):
+        return question_states
+    if is_packed(question_states):
+        if ordinals is None:
+            raise CompactStateError(
+                f"Packed question states need {ORDINALS_FILE} to decode"
+            )
+        return CompactQuestionStates.unpack(question_states, ordinals)
+    if ordinals is None:
+        return question_states
+    return CompactQuestionStates.from_dict(question_states, ordinals)
+
+
+def expand_question_states(question_states, ordinals=None):
+    """Plain ``{question_id: {...}}`` dicts for any stored/resident form."""
+    if is_packed(question_states):
+        question_states = compact_question_states(question_states, ordinals)
+    return {qid: dict(state) for qid, state in question_states.items()}
+
+
+def json_default(obj):
+    """``json.dumps(default=...)`` hook that packs compact states."""
+    if isinstance(obj, CompactQuestionStates):
+        return obj.pack()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def progress_for_api(progress):
+    """The progress document in its original API shape."""
+    states = progress.get("question_states", {})
+    if isinstance(states, CompactQuestionStates):
+        progress = dict(progress)
+        progress["question_states"] = expand_question_states(states)
+    return progress
+
+
+def roll_up_daily_activity(progress, today, window_days):
+    """Fold days older than ``window_days`` into monthly ``activity_rollup``.
+
+    Returns the rolled-up day keys so the caller can persist their removal.
+    """
+    daily = progress.get("daily_activity", {})
+    cutoff = (today - timedelta(days=window_days)).strftime("%Y-%m-%d")
+    old_days = [day for day in daily if day < cutoff]
+    if not old_days:
+        return []
+    rollup = progress.setdefault("activity_rollup", {})
+    for day in old_days:
+        activity = daily.pop(day)
+        month = rollup.setdefault(
+            day[:7],
+            {
+                "xp_earned": 0,
+                "lessons_completed": 0,
+                "questions_answered": 0,
+                "active_days": 0,
+            },
+        )
+        month["xp_earned"] += activity.get("xp_earned", 0)
+        month["lessons_completed"] += activity.get("lessons_completed", 0)
+        month["questions_answered"] += activity.get("questions_answered", 0)
+        if activity.get("streak_active", False):
+            month["active_days"] += 1
+    return old_days
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from http_encoding import dumps, precompress
+from metrics import metrics
+
+# ``encodings`` maps a Content-Encoding to the pre-compressed body.
+CachedContent = namedtuple("CachedContent", ["body", "etag", "encodings"])
+
+
+def encode_json(data):
+    return dumps(data)
+
+
+def make_content(data):
+    body = encode_json(data)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return CachedContent(body, etag, precompress(body))
+
+
+def variant_etag(etag, encoding):
+    """Each encoding of a body needs its own strong ETag."""
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against ``etag``."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ContentCache:
+    """Memoized, pre-serialized chapter index and lesson documents.
+
+    Files are read on first request (or all at once by ``preload``) and kept
+    as encoded JSON bytes, together with their ETag and compressed variants.
+    A reload builds a new cache rather than clearing this one.
+    Missing files are not memoized so arbitrary IDs cannot grow the cache.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def _get(self, key, path):
+        content = self._entries.get(key)
+        if content is None:
+            self.misses += 1
+            # First access: read and encode the file off the event loop.
+            with metrics.time("content_load_seconds", kind=key[0]):
+                content = await asyncio.to_thread(self._load, key, path)
+        else:
+            self.hits += 1
+        return content
+
+    def _load(self, key, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            content = make_content(json.load(f))
+        self._entries[key] = content
+        return content
+
+    async def chapter(self, chapter_id):
+        return await self._get(
+            ("chapter", chapter_id),
+            os.path.join(self.data_dir, f"chapter_{chapter_id}", "index.json"),
+        )
+
+    async def lesson(self, chapter_id, lesson_id):
+        return await self._get(
+            ("lesson", chapter_id, lesson_id),
+            os.path.join(
+                self.data_dir, f"chapter_{chapter_id}", f"lesson_{lesson_id}.json"
+            ),
+        )
+
+    def preload(self):
+        """Read every chapter index and lesson file now, blocking.
+
+        Malformed JSON raises, so a reload can be rejected before it is
+        served.
+        """
+        for chapter in os.scandir(self.data_dir):
+            if not chapter.is_dir() or not chapter.name.startswith("chapter_"):
+                continue
+            chapter_id = chapter.name[len("chapter_") :]
+            for entry in os.scandir(chapter.path):
+                if entry.name == "index.json":
+                    self._load(("chapter", chapter_id), entry.path)
+                elif entry.name.startswith("lesson_") and entry.name.endswith(".json"):
+                    lesson_id = entry.name[len("lesson_") : -len(".json")]
+                    self._load(("lesson", chapter_id, lesson_id), entry.path)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,146 @@
+"""Everything served from DATA_DIR, loaded as one unit.
+
+A ContentSnapshot is built completely (and validated) before it replaces
+the live one, so requests see either the old content or the new content,
+never a mix. Handlers should read the current snapshot once and use that
+reference throughout.
+"""
+import json
+import os
+from datetime import datetime
+
+from compact_state import load_question_ordinals
+from content_cache import ContentCache, make_content
+from question_bank import load_question_bank
+from question_index import QuestionIndex
+
+CHAPTERS = 30
+BANK_FILES = (
+    "question_bank.json",
+    "question_bank.bin",
+    "question_ordinals.json",
+)
+
+
+class ContentSnapshot:
+    __slots__ = (
+        "question_index",
+        "question_ordinals",
+        "chapters_data",
+        "chapters_content",
+        "content_cache",
+        "fingerprint",
+        "loaded_at",
+    )
+
+    def __init__(
+        self,
+        question_index,
+        question_ordinals,
+        chapters_data,
+        content_cache,
+        fingerprint=None,
+    ):
+        self.question_index = question_index
+        self.question_ordinals = question_ordinals
+        self.chapters_data = chapters_data
+        self.chapters_content = make_content(chapters_data)
+        self.content_cache = content_cache
+        self.fingerprint = fingerprint
+        self.loaded_at = datetime.now().isoformat()
+
+    @classmethod
+    def empty(cls, data_dir):
+        return cls(QuestionIndex([]), None, {}, ContentCache(data_dir))
+
+
+def load_chapters_list(data_dir):
+    chapters = []
+    for i in range(1, CHAPTERS + 1):
+        chapter_dir = os.path.join(data_dir, f"chapter_{i}")
+        chapter_file = os.path.join(chapter_dir, "index.json")
+        if os.path.exists(chapter_file):
+            with open(chapter_file, "r", encoding="utf-8") as f:
+                ch_data = json.load(f)
+                ch = ch_data.get("chapter", {})
+                lesson_files = [
+                    f
+                    for f in os.listdir(chapter_dir)
+                    if f.startswith("lesson_") and f.endswith(".json")
+                ]
+                lessons_count = len(lesson_files)
+                chapters.append(
+                    {
+                        "chapter_id": ch.get("chapter_id", str(i)),
+                        "title": ch.get("title", f"Chapter {i}"),
+                        "lessons_count": lessons_count,
+                        "total_xp": ch.get("total_xp", 0),
+                        "exam_weight": ch.get("exam_weight", "约1分"),
+                        "difficulty": ch.get("difficulty", 1),
+                    }
+                )
+    total_lessons = sum(ch.get("lessons_count", 0) for ch in chapters)
+    total_xp = sum(ch.get("total_xp", 0) for ch in chapters)
+    return {
+        "course_info": {
+            "title": "CPA注册会计师考试-会计科目",
+            "total_chapters": len(chapters),
+            "total_lessons": total_lessons,
+            "total_xp": total_xp,
+        },
+        "chapters": chapters,
+    }
+
+
+def data_fingerprint(data_dir):
+    """Cheap summary of the content files' sizes and mtimes, used to notice
+    changes without reading them."""
+    stats = []
+    for name in BANK_FILES:
+        try:
+            st = os.stat(os.path.join(data_dir, name))
+        except FileNotFoundError:
+            continue
+        stats.append((name, st.st_size, st.st_mtime_ns))
+    for i in range(1, CHAPTERS + 1):
+        chapter = f"chapter_{i}"
+        try:
+            entries = list(os.scandir(os.path.join(data_dir, chapter)))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.endswith(".json") and entry.is_file():
+                st = entry.stat()
+                stats.append((f"{chapter}/{entry.name}", st.st_size, st.st_mtime_ns))
+    return tuple(sorted(stats))
+
+
+def validate_snapshot(snapshot):
+    """Spot-check that the bank decodes; raises ValueError otherwise."""
+    questions = snapshot.question_index.questions
+    for position in {0, len(questions) - 1} if len(questions) else ():
+        question = questions[position]
+        if not isinstance(question, dict) or not question.get("id"):
+            raise ValueError(f"Question {position} in the bank has no ID")
+    ordinals = snapshot.question_ordinals
+    if ordinals is not None and len(set(ordinals.ids)) != len(ordinals.ids):
+        raise ValueError("question_ordinals.json has duplicate IDs")
+
+
+def build_content_snapshot(data_dir, bank_format="auto", preload=False):
+    """Load and validate a complete snapshot; blocking, run it in a thread."""
+    # Taken first, so edits made while loading show up as a later change.
+    fingerprint = data_fingerprint(data_dir)
+    _questions_data, question_index = load_question_bank(data_dir, bank_format)
+    content_cache = ContentCache(data_dir)
+    if preload:
+        content_cache.preload()
+    snapshot = ContentSnapshot(
+        question_index,
+        load_question_ordinals(data_dir),
+        load_chapters_list(data_dir),
+        content_cache,
+        fingerprint,
+    )
+    validate_snapshot(snapshot)
+    return snapshot
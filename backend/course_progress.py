@@ -0,0 +1,105 @@
+"""Per-chapter rollups of a user's completed lessons.
+
+``progress["chapter_progress"]`` maps a chapter ID to the number of distinct
+lessons completed in it and the XP of their latest completions. It is
+updated on every lesson completion, so the home screen summary never walks
+``lessons`` or ``question_states``. Completion is judged against the loaded
+chapter list at read time, so adding lessons to a chapter reopens it.
+"""
+
+
+def lesson_chapter_id(lesson_id):
+    """Chapter a lesson belongs to, e.g. "3_2" -> "3"."""
+    return str(lesson_id).split("_", 1)[0]
+
+
+def build_chapter_progress(lessons):
+    """Rollups computed from scratch, for documents saved without them."""
+    chapter_progress = {}
+    for lesson_id, lesson in lessons.items():
+        rollup = chapter_progress.setdefault(
+            lesson_chapter_id(lesson_id), {"lessons_completed": 0, "xp_earned": 0}
+        )
+        rollup["lessons_completed"] += 1
+        rollup["xp_earned"] += lesson.get("xp_earned", 0) or 0
+    return chapter_progress
+
+
+def record_lesson(chapter_progress, lesson_id, previous, xp_earned):
+    """Count a completion of ``lesson_id``; ``previous`` is its earlier
+    lessons entry, or None the first time."""
+    rollup = chapter_progress.setdefault(
+        lesson_chapter_id(lesson_id), {"lessons_completed": 0, "xp_earned": 0}
+    )
+    if previous is None:
+        rollup["lessons_completed"] += 1
+        rollup["xp_earned"] += xp_earned
+    else:
+        rollup["xp_earned"] += xp_earned - (previous.get("xp_earned", 0) or 0)
+
+
+def chapter_is_complete(rollup, chapter):
+    lessons_count = chapter.get("lessons_count", 0)
+    return lessons_count > 0 and rollup.get("lessons_completed", 0) >= lessons_count
+
+
+def count_completed_chapters(chapter_progress, chapters):
+    return sum(
+        1
+        for chapter in chapters
+        if chapter_is_complete(
+            chapter_progress.get(str(chapter.get("chapter_id")), {}), chapter
+        )
+    )
+
+
+def summarize_progress(user_data, chapters_data):
+    """Home screen summary: profile, course totals and per-chapter progress."""
+    profile = user_data.get("profile", {})
+    progress = user_data.get("progress", {})
+    chapter_progress = progress.get("chapter_progress", {})
+    course_info = chapters_data.get("course_info", {})
+
+    chapters = []
+    lessons_completed = 0
+    xp_earned = 0
+    for chapter in chapters_data.get("chapters", []):
+        rollup = chapter_progress.get(str(chapter.get("chapter_id")), {})
+        completed = min(
+            rollup.get("lessons_completed", 0), chapter.get("lessons_count", 0)
+        )
+        lessons_completed += completed
+        xp_earned += rollup.get("xp_earned", 0)
+        chapters.append(
+            {
+                "chapter_id": chapter.get("chapter_id"),
+                "title": chapter.get("title"),
+                "lessons_count": chapter.get("lessons_count", 0),
+                "lessons_completed": completed,
+                "xp_earned": rollup.get("xp_earned", 0),
+                "total_xp": chapter.get("total_xp", 0),
+                "completed": chapter_is_complete(rollup, chapter),
+            }
+        )
+
+    total_lessons = course_info.get("total_lessons", 0)
+    return {
+        "profile": {
+            key: profile.get(key)
+            for key in ("xp", "level", "streak", "lives", "last_active_date")
+        },
+        "course": {
+            "title": course_info.get("title"),
+            "total_chapters": course_info.get("total_chapters", 0),
+            "chapters_completed": sum(1 for c in chapters if c["completed"]),
+            "total_lessons": total_lessons,
+            "lessons_completed": lessons_completed,
+            "total_xp": course_info.get("total_xp", 0),
+            "xp_earned": xp_earned,
+            "completion": (
+                round(lessons_completed / total_lessons, 4) if total_lessons else 0
+            ),
+        },
+        "chapters": chapters,
+        "statistics": progress.get("statistics", {}),
+    }
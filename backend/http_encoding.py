@@ -0,0 +1,215 @@
+"""Fast JSON responses and negotiated response compression.
+
+``orjson`` and ``brotli`` are optional: without orjson responses are
+encoded with the json module, and without brotli only gzip is offered.
+Responses of at least COMPRESSION_MIN_SIZE bytes are compressed when the
+client accepts it; COMPRESSION=0 turns compression off.
+"""
+import json
+import os
+import zlib
+from collections.abc import Mapping
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# Dynamic responses favour speed; cached static content is compressed once.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+# Preference order when the client accepts several equally.
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"text/")
+
+
+def _default(obj):
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        data, ensure_ascii=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with ``dumps``.
+
+    Return it from handlers directly: a plain dict goes through FastAPI's
+    jsonable_encoder first, which is the slow part for large documents.
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """Best of ``available`` for an Accept-Encoding header, or None."""
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    best = None
+    best_q = 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, static=False):
+    if encoding == "br":
+        quality = STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY
+        return brotli.compress(body, quality=quality)
+    compressor = zlib.compressobj(
+        STATIC_GZIP_LEVEL if static else GZIP_LEVEL, zlib.DEFLATED, 31
+    )
+    return compressor.compress(body) + compressor.flush()
+
+
+def precompress(body):
+    """``{encoding: bytes}`` of the variants worth serving for ``body``."""
+    if not COMPRESSION_ENABLED or len(body) < COMPRESSION_MIN_SIZE:
+        return {}
+    variants = {}
+    for encoding in ENCODINGS:
+        encoded = compress(body, encoding, static=True)
+        if len(encoded) < len(body):
+            variants[encoding] = encoded
+    return variants
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        # Flushed per chunk so streamed lines reach the client promptly.
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing JSON and text responses.
+
+    Bodies below COMPRESSION_MIN_SIZE and responses that already carry a
+    Content-Encoding (pre-compressed content) are passed through unchanged.
+    Streamed responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope["headers"], b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1") if accept else None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                data = compressor.chunk(body)
+                if not more_body:
+                    data += compressor.finish()
+                await send(
+                    {"type": "http.response.body", "body": data, "more_body": more_body}
+                )
+                return
+
+            headers = [
+                (k, v) for k, v in start["headers"] if k.lower() != b"content-length"
+            ]
+            content_type = _header(headers, b"content-type") or b""
+            if (
+                _header(headers, b"content-encoding") is not None
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+                or (not more_body and len(body) < COMPRESSION_MIN_SIZE)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            vary = _header(headers, b"vary")
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+                headers.append((b"vary", vary + b", Accept-Encoding"))
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            if not more_body:
+                data = compress(body, encoding)
+                headers.append((b"content-length", str(len(data)).encode("latin-1")))
+            else:
+                compressor = _StreamCompressor(encoding)
+                data = compressor.chunk(body)
+            await send({**start, "headers": headers})
+            await send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,340 @@
+"""In-memory leaderboards for total XP, this week's XP and current streak.
+
+Each board is a ScoreBoard: users sorted by score in a bucketed list, so
+rank lookups and updates are O(log N) in the number of ranked users (plus
+a short shift inside one bucket), however large the scores get. Boards are
+updated from the user document after every mutation and rebuilt from the
+progress store (or a snapshot file) at startup, so serving them never
+touches per-user files.
+"""
+import hashlib
+import json
+import os
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from itertools import chain, islice
+
+from atomic_file import atomic_write
+
+BOARDS = ("xp", "weekly_xp", "streak")
+
+
+def week_key(now):
+    year, week, _ = now.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_start(now):
+    return (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+
+
+def weekly_xp(progress, now):
+    """XP earned in ``now``'s ISO week, from the per-day activity."""
+    daily = progress.get("daily_activity", {})
+    monday = now - timedelta(days=now.weekday())
+    total = 0
+    for offset in range(7):
+        day = (monday + timedelta(days=offset)).strftime("%Y-%m-%d")
+        activity = daily.get(day)
+        if activity is not None:
+            total += activity.get("xp_earned", 0)
+    return total
+
+
+def streak_is_current(last_active_date, now):
+    """A streak only counts while the user was active today or yesterday."""
+    if last_active_date is None:
+        return False
+    yesterday = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    return last_active_date >= yesterday
+
+
+def public_handle(user_id):
+    """Stable display name; visitor IDs double as credentials, so never
+    expose them on a shared board."""
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=4).hexdigest()
+    return f"player-{digest}"
+
+
+class SortedEntries:
+    """Sorted list kept as buckets of up to ``2 * load`` entries.
+
+    A Fenwick tree over the bucket sizes turns a position inside a bucket
+    into an overall index, so ``add``, ``remove`` and ``bisect_left`` never
+    shift more than one bucket, unlike ``insort`` on one long list.
+    """
+
+    def __init__(self, entries=(), load=1000):
+        self.load = load
+        entries = sorted(entries)
+        self._buckets = [
+            entries[i : i + load] for i in range(0, len(entries), load)
+        ]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(entries)
+        self._rebuild_tree()
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._buckets)
+
+    def _rebuild_tree(self):
+        tree = [0] * (len(self._buckets) + 1)
+        for i, bucket in enumerate(self._buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _resize(self, pos, delta):
+        tree = self._tree
+        i = pos + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, pos):
+        """Entries in the buckets before ``pos``."""
+        tree = self._tree
+        total = 0
+        while pos:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def add(self, value):
+        self._len += 1
+        if not self._buckets:
+            self._buckets.append([value])
+            self._maxes.append(value)
+            self._rebuild_tree()
+            return
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._buckets[pos].append(value)
+            self._maxes[pos] = value
+        else:
+            insort(self._buckets[pos], value)
+        bucket = self._buckets[pos]
+        if len(bucket) > 2 * self.load:
+            half = len(bucket) // 2
+            self._buckets[pos : pos + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[pos : pos + 1] = [bucket[half - 1], bucket[-1]]
+            self._rebuild_tree()
+        else:
+            self._resize(pos, 1)
+
+    def remove(self, value):
+        """Remove ``value``, which must be present."""
+        pos = bisect_left(self._maxes, value)
+        bucket = self._buckets[pos]
+        del bucket[bisect_left(bucket, value)]
+        self._len -= 1
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+            self._resize(pos, -1)
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+            self._rebuild_tree()
+
+    def bisect_left(self, value):
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return self._len
+        return self._count_before(pos) + bisect_left(self._buckets[pos], value)
+
+    def head(self, n):
+        return list(islice(self, max(0, n)))
+
+
+class ScoreBoard:
+    """user_id -> non-negative integer score with rank queries.
+
+    Only positive scores are ranked. Equal scores share a rank.
+    """
+
+    def __init__(self, scores=None):
+        self.scores = {}
+        entries = []
+        for user_id, score in (scores or {}).items():
+            score = max(0, int(score))
+            if score:
+                self.scores[user_id] = score
+                entries.append((-score, user_id))
+        # (-score, user_id), best first.
+        self._entries = SortedEntries(entries)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def set(self, user_id, score):
+        score = max(0, int(score))
+        old = self.scores.get(user_id, 0)
+        if old == score:
+            return
+        if old:
+            self._entries.remove((-old, user_id))
+        if score:
+            self.scores[user_id] = score
+            self._entries.add((-score, user_id))
+        else:
+            self.scores.pop(user_id, None)
+
+    def remove(self, user_id):
+        self.set(user_id, 0)
+
+    def rank(self, user_id):
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        # (-score,) sorts before every (-score, user_id) entry.
+        return self._entries.bisect_left((-score,)) + 1
+
+    def top(self, n):
+        """``[(rank, user_id, score)]`` for the best ``n`` users."""
+        result = []
+        rank = 0
+        previous = None
+        for i, (negative, user_id) in enumerate(self._entries.head(n)):
+            if negative != previous:
+                rank = i + 1
+                previous = negative
+            result.append((rank, user_id, -negative))
+        return result
+
+
+class Leaderboard:
+    def __init__(self):
+        self.boards = {name: ScoreBoard() for name in BOARDS}
+        self.week = None
+        self.day = None
+        # Last active day of users on the streak board, for the daily sweep.
+        self.streak_days = {}
+        self.changed = False
+
+    def _roll(self, now):
+        week = week_key(now)
+        if week != self.week:
+            if self.week is not None:
+                self.boards["weekly_xp"] = ScoreBoard()
+            self.week = week
+        day = now.strftime("%Y-%m-%d")
+        if day != self.day:
+            self.day = day
+            streaks = self.boards["streak"]
+            for user_id, last_active in list(self.streak_days.items()):
+                if not streak_is_current(last_active, now):
+                    streaks.remove(user_id)
+                    del self.streak_days[user_id]
+
+    def set_scores(self, user_id, xp, week_xp, streak, last_active_date, now):
+        self._roll(now)
+        self.boards["xp"].set(user_id, xp)
+        self.boards["weekly_xp"].set(user_id, week_xp)
+        if streak and streak_is_current(last_active_date, now):
+            self.boards["streak"].set(user_id, streak)
+            self.streak_days[user_id] = last_active_date
+        else:
+            self.boards["streak"].remove(user_id)
+            self.streak_days.pop(user_id, None)
+        self.changed = True
+
+    def update(self, user_id, user_data, now=None):
+        """Refresh a user's scores from their document."""
+        now = now or datetime.now()
+        profile = user_data.get("profile", {})
+        self.set_scores(
+            user_id,
+            profile.get("xp", 0),
+            weekly_xp(user_data.get("progress", {}), now),
+            profile.get("streak", 0),
+            profile.get("last_active_date"),
+            now,
+        )
+
+    def standings(self, board, user_id, limit, now=None):
+        self._roll(now or datetime.now())
+        scores = self.boards[board]
+        me = scores.rank(user_id)
+        return {
+            "board": board,
+            "week": self.week if board == "weekly_xp" else None,
+            "total_players": len(scores),
+            "top": [
+                {
+                    "rank": rank,
+                    "player": public_handle(uid),
+                    "score": score,
+                    "is_me": uid == user_id,
+                }
+                for rank, uid, score in scores.top(limit)
+            ],
+            "me": {
+                "rank": me,
+                "player": public_handle(user_id),
+                "score": scores.scores.get(user_id, 0),
+            },
+        }
+
+    def snapshot(self):
+        """JSON-serializable copy of the scores, taken on the event loop."""
+        xp = self.boards["xp"].scores
+        week_xp = self.boards["weekly_xp"].scores
+        streaks = self.boards["streak"].scores
+        users = {}
+        for user_id in xp.keys() | week_xp.keys() | streaks.keys():
+            users[user_id] = [
+                xp.get(user_id, 0),
+                week_xp.get(user_id, 0),
+                streaks.get(user_id, 0),
+                self.streak_days.get(user_id),
+            ]
+        self.changed = False
+        return {"week": self.week, "users": users}
+
+
+def leaderboard_from_rows(rows, now=None):
+    """Build a Leaderboard from ``(user_id, xp, week_xp, streak,
+    last_active_date)`` rows, with week_xp counted from ``week_start(now)``."""
+    now = now or datetime.now()
+    board = Leaderboard()
+    board._roll(now)
+    scores = {name: {} for name in BOARDS}
+    # Each board is sorted once rather than built one insert at a time.
+    for user_id, xp, week_xp, streak, last_active_date in rows:
+        scores["xp"][user_id] = xp
+        scores["weekly_xp"][user_id] = week_xp
+        if streak and streak_is_current(last_active_date, now):
+            scores["streak"][user_id] = streak
+            board.streak_days[user_id] = last_active_date
+    board.boards = {name: ScoreBoard(scores[name]) for name in BOARDS}
+    return board
+
+
+def load_leaderboard_snapshot(path, now=None):
+    """Leaderboard saved by save_leaderboard_snapshot, or None if missing."""
+    if not os.path.exists(path):
+        return None
+    now = now or datetime.now()
+    with open(path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    same_week = snapshot.get("week") == week_key(now)
+    return leaderboard_from_rows(
+        (
+            (user_id, xp, week_xp if same_week else 0, streak, last_active)
+            for user_id, (xp, week_xp, streak, last_active) in snapshot[
+                "users"
+            ].items()
+        ),
+        now,
+    )
+
+
+def save_leaderboard_snapshot(snapshot, path):
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
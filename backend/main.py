@@ -1,13 +1,61 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
-import json
+import asyncio
+import logging
 import os
+import random
+import re
+import threading
 import uuid
+import weakref
 from datetime import datetime, timedelta
 from typing import Optional
 
+from progress_store import UNLOADED, create_progress_store
+from compact_state import (
+    compact_question_states,
+    json_default,
+    roll_up_daily_activity,
+)
+from leaderboard import (
+    BOARDS,
+    Leaderboard,
+    leaderboard_from_rows,
+    load_leaderboard_snapshot,
+    save_leaderboard_snapshot,
+    week_start,
+)
+from change_log import (
+    needs_question_states,
+    progress_delta,
+    progress_document,
+    record_changes,
+)
+from content_cache import etag_matches, variant_etag
+from course_progress import (
+    build_chapter_progress,
+    count_completed_chapters,
+    record_lesson,
+    summarize_progress,
+)
+from content_snapshot import ContentSnapshot, build_content_snapshot, data_fingerprint
+from http_encoding import (
+    COMPRESSION_ENABLED,
+    CompressionMiddleware,
+    FastJSONResponse,
+    choose_encoding,
+)
+from metrics import RequestMetricsMiddleware, metrics, profiler
+from question_stats import (
+    GROUP_FIELDS,
+    QuestionStatsAggregator,
+    summarize_question_stats,
+)
+from spaced_repetition import ReviewIndex, schedule
+from user_cache import LRUUserCache
+
 def load_env():
     env_file = os.path.join(os.path.dirname(__file__), "..", "..", "data", ".env")
     if os.path.exists(env_file):
@@ -24,12 +72,112 @@ load_env()
 DATA_DIR = os.path.join(
     os.path.dirname(__file__), os.environ.get("DATA_DIR", "../data")
 )
-questions_data = {}
-chapters_data = {}
-user_progress_cache = {}
+# "auto" prefers the compiled question_bank.bin when it is up to date.
+QUESTION_BANK_FORMAT = os.environ.get("QUESTION_BANK_FORMAT", "auto")
+# Question bank, indexes, chapter list and lesson cache, replaced as a whole
+# by reload_content(); see content_snapshot.py.
+content_snapshot = ContentSnapshot.empty(DATA_DIR)
+content_reload_lock = asyncio.Lock()
+# Read every lesson file when building a snapshot, so malformed lessons fail
+# the reload instead of a request; 0 loads them on first request instead.
+CONTENT_PRELOAD = os.environ.get("CONTENT_PRELOAD", "1") == "1"
+# Seconds between checks of DATA_DIR for changed content; 0 disables.
+CONTENT_WATCH_INTERVAL = float(os.environ.get("CONTENT_WATCH_INTERVAL", "0"))
+# Course content only changes on deploy or refresh-data; clients revalidate
+# with If-None-Match once max-age runs out.
+CONTENT_CACHE_CONTROL = os.environ.get(
+    "CONTENT_CACHE_CONTROL", "public, max-age=300, must-revalidate"
+)
+# Shared-state mode lets several workers/replicas serve the same users: the
+# SQLite store is the source of truth, writes go straight to it, and the
+# in-process cache is only a read-through layer with a short TTL.
+SHARED_STATE = os.environ.get("SHARED_STATE", "0") == "1"
+SHARED_STATE_TTL = float(os.environ.get("SHARED_STATE_TTL", "1.0"))
+SHARED_STATE_MAX_RETRIES = 5
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_MAX_BYTES = int(os.environ.get("USER_CACHE_MAX_BYTES", "0"))
+user_progress_cache = LRUUserCache(
+    USER_CACHE_MAX_ENTRIES,
+    USER_CACHE_MAX_BYTES,
+    ttl=SHARED_STATE_TTL if SHARED_STATE else 0,
+)
+review_index = ReviewIndex(USER_CACHE_MAX_ENTRIES)
 USER_COOKIE_NAME = "cpa_user_id"
+# Visitor IDs name files and cache keys, so keep them to safe characters.
+VISITOR_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,128}")
 USER_DATA_DIR = os.path.join(DATA_DIR, "user_progress")
 
+# Write-behind persistence: handlers mark users dirty and a background task
+# writes them out every USER_FLUSH_INTERVAL seconds, or sooner once
+# USER_FLUSH_THRESHOLD users are pending.
+USER_FLUSH_INTERVAL = float(os.environ.get("USER_FLUSH_INTERVAL", "2.0"))
+USER_FLUSH_THRESHOLD = int(os.environ.get("USER_FLUSH_THRESHOLD", "200"))
+dirty_users = {}
+# Dirty documents dropped from user_progress_cache, waiting for the flusher.
+evicted_users = {}
+# Documents handed to the store by a running flush, until its write returns.
+flushing_users = {}
+flush_wakeup = None
+# Serializes read-modify-write of one user's progress across requests.
+user_locks = weakref.WeakValueDictionary()
+
+# "json" keeps one file per user under USER_DATA_DIR, "sqlite" stores
+# normalized rows in PROGRESS_DB_PATH (see progress_store.py).
+PROGRESS_STORE = os.environ.get(
+    "PROGRESS_STORE", "sqlite" if SHARED_STATE else "json"
+)
+if SHARED_STATE and PROGRESS_STORE != "sqlite":
+    raise RuntimeError("SHARED_STATE=1 requires PROGRESS_STORE=sqlite")
+PROGRESS_DB_PATH = os.environ.get(
+    "PROGRESS_DB_PATH", os.path.join(DATA_DIR, "user_progress.db")
+)
+progress_store = create_progress_store(
+    PROGRESS_STORE, USER_DATA_DIR, PROGRESS_DB_PATH, json_default=json_default
+)
+
+# Days of per-day daily_activity kept before folding them into monthly
+# activity_rollup totals.
+DAILY_ACTIVITY_WINDOW_DAYS = int(os.environ.get("DAILY_ACTIVITY_WINDOW_DAYS", "120"))
+
+# Leaderboards live in memory. With the JSON store they are saved to
+# LEADERBOARD_SNAPSHOT_PATH every LEADERBOARD_SYNC_INTERVAL seconds and on
+# shutdown (a missing snapshot means one scan of USER_DATA_DIR at startup);
+# with SQLite they are rebuilt from the database at startup, and in
+# shared-state mode re-read every interval to pick up other workers' updates.
+LEADERBOARD_SNAPSHOT_PATH = os.environ.get(
+    "LEADERBOARD_SNAPSHOT_PATH", os.path.join(DATA_DIR, "leaderboard_snapshot.json")
+)
+LEADERBOARD_SYNC_INTERVAL = float(os.environ.get("LEADERBOARD_SYNC_INTERVAL", "60"))
+leaderboard = Leaderboard()
+
+# Answer counts per question across all users, added to the store's totals
+# every QUESTION_STATS_FLUSH_INTERVAL seconds (see question_stats.py).
+QUESTION_STATS_FLUSH_INTERVAL = float(
+    os.environ.get("QUESTION_STATS_FLUSH_INTERVAL", "30")
+)
+question_stats = QuestionStatsAggregator()
+
+# JSON store only: users whose file was not written for ARCHIVE_IDLE_DAYS are
+# packed into per-shard archives every ARCHIVE_INTERVAL seconds (0 = never).
+ARCHIVE_IDLE_DAYS = float(os.environ.get("ARCHIVE_IDLE_DAYS", "0"))
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "21600"))
+
+# Rows remembered per user for /api/user/progress?since= (see change_log.py).
+PROGRESS_CHANGE_LOG_KEYS = int(os.environ.get("PROGRESS_CHANGE_LOG_KEYS", "256"))
+
+# Queued answers older than this count as answered now (see parse_client_time).
+ANSWER_MAX_AGE = timedelta(hours=float(os.environ.get("ANSWER_MAX_AGE_HOURS", "24")))
+
+# Most XP one lesson completion may award; larger client claims are clamped.
+MAX_LESSON_XP = int(os.environ.get("MAX_LESSON_XP", "100"))
+
+# Paged /api/questions and the NDJSON export.
+QUESTION_PAGE_SIZE = 20
+MAX_QUESTION_PAGE_SIZE = int(os.environ.get("MAX_QUESTION_PAGE_SIZE", "100"))
+EXPORT_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
 
 def get_default_user_profile():
     return {
@@ -45,7 +193,10 @@ def get_default_user_profile():
 def get_default_user_progress():
     return {
         "lessons": {},
-        "question_states": {},
+        "question_states": compact_question_states(
+            {}, content_snapshot.question_ordinals
+        ),
+        "chapter_progress": {},
         "achievements": [],
         "statistics": {
             "total_questions_answered": 0,
@@ -62,26 +213,64 @@ def get_default_user_progress():
     }
 
 
-def load_user_data(user_id):
+class ProgressStoreUnavailable(Exception):
+    """The progress store could not be read; answered with a 503."""
+
+
+class InvalidVisitorId(Exception):
+    """The client sent a malformed visitor ID; answered with a 400."""
+
+
+async def load_user_data(user_id):
     # Basic validation for visitor id - accept any non-empty string
     if not user_id or not isinstance(user_id, str) or len(user_id.strip()) == 0:
         user_id = str(uuid.uuid4())
-    if user_id in user_progress_cache:
-        return user_progress_cache[user_id]
+    data = user_progress_cache.get(user_id)
+    if data is not None:
+        return data
 
-    progress_file = os.path.join(USER_DATA_DIR, f"{user_id}.json")
-    if os.path.exists(progress_file):
-        try:
-            with open(progress_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = {
-                "profile": get_default_user_profile(),
-                "progress": get_default_user_progress(),
-            }
-            user_progress_cache[user_id] = data
-            save_user_data(user_id)
-            return data
+    evicted = evicted_users.pop(user_id, None)
+    if evicted is not None:
+        # Evicted before its write-back ran: take the in-memory copy back.
+        data, changes = evicted
+        user_progress_cache[user_id] = data
+        mark_user_dirty(user_id, changes)
+        return data
+    data = flushing_users.get(user_id)
+    if data is not None:
+        # Being written right now; the store still has the older copy.
+        user_progress_cache[user_id] = data
+        return data
+
+    try:
+        # question_states is fetched by ensure_question_states when needed.
+        with metrics.time("user_load_seconds"):
+            data = await asyncio.to_thread(progress_store.load, user_id, True)
+    except ValueError:
+        # Corrupt document: start over and overwrite it on the next flush.
+        logger.warning("Discarding an unreadable progress document")
+        data = {
+            "profile": get_default_user_profile(),
+            "progress": get_default_user_progress(),
+        }
+        user_progress_cache[user_id] = data
+        mark_user_dirty(user_id)
+        return data
+    except Exception as e:
+        # The store itself failed (locked, I/O error); the stored document
+        # may be fine, so never replace it with defaults.
+        raise ProgressStoreUnavailable() from e
+    if data is not None:
+        progress = data.setdefault("progress", {})
+        if progress.get("question_states") is not UNLOADED:
+            progress["question_states"] = compact_question_states(
+                progress.get("question_states", {}),
+                content_snapshot.question_ordinals,
+            )
+        if "chapter_progress" not in progress:
+            progress["chapter_progress"] = build_chapter_progress(
+                progress.get("lessons", {})
+            )
         user_progress_cache[user_id] = data
         return data
 
@@ -93,22 +282,237 @@ def load_user_data(user_id):
     return data
 
 
-def save_user_data(user_id):
-    if user_id not in user_progress_cache:
+async def ensure_question_states(user_id, user_data):
+    """Load the user's question_states if only the core was loaded.
+
+    Call it, holding the user's lock, before anything reads or writes them.
+    """
+    progress = user_data["progress"]
+    if progress.get("question_states") is not UNLOADED:
         return
+    try:
+        with metrics.time("user_section_load_seconds"):
+            states = await asyncio.to_thread(
+                progress_store.load_section, user_id, "question_states"
+            )
+    except ValueError:
+        raise  # Corrupt states are an error, not a reason to retry.
+    except Exception as e:
+        raise ProgressStoreUnavailable() from e
+    # Another request may have loaded them while this one waited.
+    if progress.get("question_states") is UNLOADED:
+        progress["question_states"] = compact_question_states(
+            states, content_snapshot.question_ordinals
+        )
+
+
+def get_user_lock(user_id):
+    lock = user_locks.get(user_id)
+    if lock is None:
+        lock = user_locks[user_id] = asyncio.Lock()
+    return lock
+
+
+def mark_user_dirty(user_id, changes=None):
+    """Queue a user for the next flush.
+
+    ``changes`` lists the ``(section, key)`` rows touched, e.g.
+    ``[("question_states", qid)]``; an empty list means only the profile and
+    statistics changed, and None forces a full rewrite.
+    """
+    if changes is not None and dirty_users.get(user_id, ()) is not None:
+        dirty_users.setdefault(user_id, set()).update(changes)
+    else:
+        dirty_users[user_id] = None
+    if len(dirty_users) >= USER_FLUSH_THRESHOLD and flush_wakeup is not None:
+        flush_wakeup.set()
+
+
+async def flush_dirty_users():
+    global dirty_users, evicted_users
+    pending, dirty_users = dirty_users, {}
+    evicted, evicted_users = evicted_users, {}
+    items = [(user_id, data, changes) for user_id, (data, changes) in evicted.items()]
+    items.extend(
+        (user_id, user_progress_cache[user_id], changes)
+        for user_id, changes in pending.items()
+        if user_id in user_progress_cache
+    )
+    if not items:
+        return
+    # Serialize on the loop, where handlers cannot be mutating the documents,
+    # then do the disk/database work in a thread.
+    for user_id, data, _changes in items:
+        flushing_users[user_id] = data
+    try:
+        with metrics.time("user_flush_seconds"):
+            payload = progress_store.prepare(items)
+            rejected = await asyncio.to_thread(progress_store.write, payload)
+        if rejected:
+            # The rest of the batch was saved; keep these in memory and retry.
+            logger.error("Progress store rejected %d users", len(rejected))
+            rejected = set(rejected)
+            requeue_unsaved(item for item in items if item[0] in rejected)
+        if metrics.enabled:
+            metrics.inc("user_saves_total", len(items) - len(rejected))
+            written = progress_store.payload_bytes(payload)
+            if written is not None:
+                metrics.inc("user_bytes_written_total", written)
+    except Exception:
+        logger.exception("Failed to persist progress for %d users", len(items))
+        requeue_unsaved(items)
+    finally:
+        for user_id, data, _changes in items:
+            if flushing_users.get(user_id) is data:
+                del flushing_users[user_id]
+
+
+def requeue_unsaved(items):
+    """Retry unsaved ``(user_id, data, changes)`` items with a full rewrite."""
+    for user_id, data, _changes in items:
+        if user_id in user_progress_cache:
+            dirty_users[user_id] = None
+        elif user_id not in evicted_users:
+            evicted_users[user_id] = (data, None)
+
+
+def evict_user(user_id, data):
+    lock = user_locks.get(user_id)
+    if lock is not None and lock.locked():
+        # A request is working on this document right now.
+        return False
+    changes = dirty_users.pop(user_id, False)
+    if changes is not False:
+        evicted_users[user_id] = (data, changes)
+    review_index.forget(user_id)
+    return True
+
+
+user_progress_cache.on_evict = evict_user
+
+
+async def flush_question_stats():
+    pending = question_stats.take()
+    if not pending:
+        return
+    try:
+        await asyncio.to_thread(progress_store.add_question_stats, pending)
+    except Exception:
+        logger.exception("Failed to flush question stats")
+        question_stats.restore(pending)
+
+
+async def user_flush_loop(stop):
+    loop = asyncio.get_running_loop()
+    stats_flushed_at = loop.time()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(flush_wakeup.wait(), timeout=USER_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        flush_wakeup.clear()
+        await flush_dirty_users()
+        if loop.time() - stats_flushed_at >= QUESTION_STATS_FLUSH_INTERVAL:
+            stats_flushed_at = loop.time()
+            await flush_question_stats()
+
+
+def build_leaderboard():
+    now = datetime.now()
+    if PROGRESS_STORE == "json":
+        board = load_leaderboard_snapshot(LEADERBOARD_SNAPSHOT_PATH, now)
+        if board is not None:
+            return board
+    return leaderboard_from_rows(progress_store.leaderboard_rows(week_start(now)), now)
+
+
+async def save_leaderboard():
+    if PROGRESS_STORE == "json" and leaderboard.changed:
+        await asyncio.to_thread(
+            save_leaderboard_snapshot, leaderboard.snapshot(), LEADERBOARD_SNAPSHOT_PATH
+        )
+
+
+async def archive_loop(stop):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=ARCHIVE_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            pass
+        # Users held in memory are still in use; leave their files alone.
+        skip = (
+            set(user_progress_cache.keys())
+            | set(dirty_users)
+            | set(evicted_users)
+            | set(flushing_users)
+            | set(user_locks.keys())
+        )
+        try:
+            archived = await asyncio.to_thread(
+                progress_store.archive_idle_users, ARCHIVE_IDLE_DAYS, skip
+            )
+            metrics.inc("users_archived_total", archived)
+            if archived:
+                logger.info("Archived %d idle users", archived)
+        except Exception:
+            logger.exception("Archiving idle users failed")
+
 
-    progress_file = os.path.join(USER_DATA_DIR, f"{user_id}.json")
-    with open(progress_file, "w", encoding="utf-8") as f:
-        json.dump(user_progress_cache[user_id], f, ensure_ascii=False, indent=2)
+async def leaderboard_sync_loop(stop):
+    global leaderboard
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LEADERBOARD_SYNC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            if SHARED_STATE:
+                leaderboard = await asyncio.to_thread(build_leaderboard)
+            else:
+                await save_leaderboard()
+        except Exception:
+            logger.exception("Leaderboard sync failed")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    load_data()
+    global flush_wakeup, leaderboard, content_snapshot
+    content_snapshot = await asyncio.to_thread(
+        build_content_snapshot, DATA_DIR, QUESTION_BANK_FORMAT, CONTENT_PRELOAD
+    )
+    leaderboard = await asyncio.to_thread(build_leaderboard)
+    flush_wakeup = asyncio.Event()
+    stop_flusher = asyncio.Event()
+    flusher = asyncio.create_task(user_flush_loop(stop_flusher))
+    leaderboard_syncer = asyncio.create_task(leaderboard_sync_loop(stop_flusher))
+    content_watcher = None
+    if CONTENT_WATCH_INTERVAL > 0:
+        content_watcher = asyncio.create_task(content_watch_loop(stop_flusher))
+    archiver = None
+    if ARCHIVE_IDLE_DAYS > 0:
+        archiver = asyncio.create_task(archive_loop(stop_flusher))
     yield
-
-
-app = FastAPI(title="CPA_PATH API", version="1.0.0", lifespan=lifespan)
+    stop_flusher.set()
+    flush_wakeup.set()
+    await flusher
+    await leaderboard_syncer
+    if content_watcher is not None:
+        await content_watcher
+    if archiver is not None:
+        await archiver
+    await flush_dirty_users()
+    await flush_question_stats()
+    await save_leaderboard()
+    progress_store.close()
+
+
+app = FastAPI(
+    title="CPA_PATH API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -123,77 +527,149 @@ app.add_middleware(
 )
 
 
-@app.middleware("http")
-async def user_identity_middleware(request: Request, call_next):
-    if request.method == "OPTIONS":
-        return await call_next(request)
+class VisitorHeaderMiddleware:
+    """Send X-CPA-Visitor to visitors resolve_user gave a new ID.
+
+    Set on the final response rather than on an injected Response, whose
+    headers FastAPI drops when a handler returns a Response of its own.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Shared with request.state in the handler's (possibly copied) scope.
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message):
+            visitor_id = state.get("new_visitor_id")
+            if message["type"] == "http.response.start" and visitor_id:
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"x-cpa-visitor", visitor_id.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+app.add_middleware(VisitorHeaderMiddleware)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if metrics.enabled:
+    app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
+
+
+@app.exception_handler(ProgressStoreUnavailable)
+async def progress_store_unavailable(request: Request, exc: ProgressStoreUnavailable):
+    logger.error("Progress store unavailable", exc_info=exc.__cause__)
+    return FastJSONResponse(
+        {"success": False, "error": "Progress temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(InvalidVisitorId)
+async def invalid_visitor_id(request: Request, exc: InvalidVisitorId):
+    return FastJSONResponse(
+        {"success": False, "error": "Invalid visitor ID"}, status_code=400
+    )
+
+
+def collect_runtime_metrics():
+    stats = user_progress_cache.stats()
+    yield "user_cache_hits_total", "counter", {}, stats["hits"]
+    yield "user_cache_misses_total", "counter", {}, stats["misses"]
+    yield "user_cache_evictions_total", "counter", {}, stats["evictions"]
+    yield "user_cache_entries", "gauge", {}, stats["entries"]
+    yield "user_cache_approx_bytes", "gauge", {}, stats["approx_bytes"]
+    content_cache = content_snapshot.content_cache
+    yield "content_cache_hits_total", "counter", {}, content_cache.hits
+    yield "content_cache_misses_total", "counter", {}, content_cache.misses
+    yield "content_cache_entries", "gauge", {}, len(content_cache)
+    yield "dirty_users", "gauge", {}, len(dirty_users)
+    yield "evicted_pending_users", "gauge", {}, len(evicted_users)
+    yield "question_stats_pending", "gauge", {}, len(question_stats)
+    for name, board in leaderboard.boards.items():
+        yield "leaderboard_players", "gauge", {"board": name}, len(board)
+
+
+metrics.register_collector(collect_runtime_metrics)
+
+
+async def resolve_user(request: Request):
+    """Attach the visitor's progress to ``request.state``.
 
+    Only user-scoped routes depend on this, so content requests never touch
+    the progress store. The user's lock is held until the handler returns,
+    so concurrent requests for one user apply their changes one at a time.
+    Visitors without an ID get a fresh one back in the X-CPA-Visitor header;
+    their default profile is only persisted once a handler marks it dirty.
+    """
     visitor_id = request.headers.get("X-CPA-Visitor")
     if not visitor_id:
         visitor_id = request.cookies.get(USER_COOKIE_NAME)
-    new_user = False
     if (
         not visitor_id
         or not isinstance(visitor_id, str)
         or len(visitor_id.strip()) == 0
     ):
         visitor_id = str(uuid.uuid4())
-        new_user = True
-    user_data = load_user_data(visitor_id)
-    request.state.user_id = visitor_id
-    request.state.user_data = user_data
-    response = await call_next(request)
-    save_user_data(visitor_id)
-    if new_user:
-        response.headers["X-CPA-Visitor"] = visitor_id
-    return response
-
-
-def load_chapters_list():
-    chapters = []
-    for i in range(1, 31):
-        chapter_dir = os.path.join(DATA_DIR, f"chapter_{i}")
-        chapter_file = os.path.join(chapter_dir, "index.json")
-        if os.path.exists(chapter_file):
-            with open(chapter_file, "r", encoding="utf-8") as f:
-                ch_data = json.load(f)
-                ch = ch_data.get("chapter", {})
-                lesson_files = [
-                    f
-                    for f in os.listdir(chapter_dir)
-                    if f.startswith("lesson_") and f.endswith(".json")
-                ]
-                lessons_count = len(lesson_files)
-                chapters.append(
-                    {
-                        "chapter_id": ch.get("chapter_id", str(i)),
-                        "title": ch.get("title", f"Chapter {i}"),
-                        "lessons_count": lessons_count,
-                        "total_xp": ch.get("total_xp", 0),
-                        "exam_weight": ch.get("exam_weight", "约1分"),
-                        "difficulty": ch.get("difficulty", 1),
-                    }
-                )
-    total_lessons = sum(ch.get("lessons_count", 0) for ch in chapters)
-    total_xp = sum(ch.get("total_xp", 0) for ch in chapters)
-    return {
-        "course_info": {
-            "title": "CPA注册会计师考试-会计科目",
-            "total_chapters": len(chapters),
-            "total_lessons": total_lessons,
-            "total_xp": total_xp,
-        },
-        "chapters": chapters,
-    }
-
-
-def load_data():
-    global questions_data, chapters_data
+        # Sent back by VisitorHeaderMiddleware.
+        request.state.new_visitor_id = visitor_id
+    elif not VISITOR_ID_PATTERN.fullmatch(visitor_id):
+        raise InvalidVisitorId()
+    async with get_user_lock(visitor_id):
+        request.state.user_id = visitor_id
+        request.state.user_data = await load_user_data(visitor_id)
+        yield
+
+
+async def reload_content():
+    """Build a new content snapshot in a thread, then swap it in.
+
+    Requests keep using the old snapshot until the new one is complete and
+    validated; if anything fails the old one stays live and the error is
+    raised.
+    """
+    global content_snapshot
+    async with content_reload_lock:
+        snapshot = await asyncio.to_thread(
+            build_content_snapshot, DATA_DIR, QUESTION_BANK_FORMAT, CONTENT_PRELOAD
+        )
+        if len(snapshot.question_index) == 0 and len(content_snapshot.question_index):
+            raise ValueError("Refusing to replace the question bank with an empty one")
+        content_snapshot = snapshot
+    return snapshot
 
-    with open(os.path.join(DATA_DIR, "question_bank.json"), "r", encoding="utf-8") as f:
-        questions_data = json.load(f)
 
-    chapters_data = load_chapters_list()
+async def content_watch_loop(stop):
+    """Reload content when files under DATA_DIR change."""
+    failed_fingerprint = None
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=CONTENT_WATCH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if stop.is_set():
+            break
+        fingerprint = await asyncio.to_thread(data_fingerprint, DATA_DIR)
+        if fingerprint in (content_snapshot.fingerprint, failed_fingerprint):
+            continue
+        try:
+            await reload_content()
+            logger.info("Content reloaded after a change in %s", DATA_DIR)
+        except Exception:
+            # Often a file caught mid-write; retry once it changes again.
+            failed_fingerprint = fingerprint
+            logger.exception("Content reload failed; still serving the old data")
 
 
 @app.get("/")
@@ -208,50 +684,148 @@ async def refresh_data():
     Use for development when you modify files under backend/data.
     """
     try:
-        load_data()
-        return {"success": True, "message": "Data refreshed from disk"}
+        snapshot = await reload_content()
+        return {
+            "success": True,
+            "message": "Data refreshed from disk",
+            "total_questions": len(snapshot.question_index),
+            "loaded_at": snapshot.loaded_at,
+        }
     except Exception as e:
-        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+        return FastJSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 
 @app.get("/api/admin/refresh-data")
 async def refresh_data_get():
     try:
-        load_data()
-        return {"success": True, "message": "Data refreshed from disk (GET)"}
+        snapshot = await reload_content()
+        return {
+            "success": True,
+            "message": "Data refreshed from disk (GET)",
+            "total_questions": len(snapshot.question_index),
+            "loaded_at": snapshot.loaded_at,
+        }
     except Exception as e:
-        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+        return FastJSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+
+@app.get("/api/admin/cache-stats")
+async def cache_stats():
+    return {
+        "user_cache": user_progress_cache.stats(),
+        "content_cache_entries": len(content_snapshot.content_cache),
+        "content_loaded_at": content_snapshot.loaded_at,
+        "dirty_users": len(dirty_users),
+        "evicted_pending": len(evicted_users),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition; 404 unless the server runs with METRICS=1."""
+    if not metrics.enabled:
+        return FastJSONResponse(
+            {"success": False, "error": "Metrics are disabled"}, status_code=404
+        )
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.post("/api/admin/profiler/start")
+async def start_profiler(interval: float = 0.005):
+    """Start sampling the event loop thread's stack every ``interval`` s."""
+    interval = max(0.001, min(interval, 1.0))
+    # Handlers run on the event loop thread, which is the one to sample.
+    started = profiler.start(threading.get_ident(), interval)
+    return {"success": started, "running": profiler.running}
+
+
+@app.post("/api/admin/profiler/stop")
+async def stop_profiler(limit: int = 200):
+    """Stop the profiler and return folded stacks, busiest first."""
+    await asyncio.to_thread(profiler.stop)
+    return profiler.report(limit)
+
+
+@app.get("/api/admin/profiler")
+async def get_profiler(limit: int = 200):
+    return profiler.report(limit)
+
+
+@app.get("/api/admin/question-stats")
+async def get_question_stats(
+    group_by: str = "question", min_attempts: int = 1, limit: int = 100
+):
+    """Answer accuracy across all users, least accurate first.
+
+    ``group_by`` is "question", "chapter", "type" or "difficulty".
+    """
+    if group_by != "question" and group_by not in GROUP_FIELDS:
+        return FastJSONResponse(
+            {"success": False, "error": f"Unknown group_by: {group_by}"},
+            status_code=400,
+        )
+    await flush_question_stats()
+    totals = await asyncio.to_thread(progress_store.load_question_stats)
+    question_index = content_snapshot.question_index
+
+    def question_for(question_id):
+        position = question_index.position_of(question_id)
+        if position is None:
+            return None
+        return question_index.questions[position]
+
+    rows = await asyncio.to_thread(
+        summarize_question_stats, totals, question_for, group_by, min_attempts
+    )
+    return FastJSONResponse(
+        {"group_by": group_by, "total": len(rows), "rows": rows[: max(0, limit)]}
+    )
+
+
+def content_response(request, content):
+    """Serve cached content, pre-compressed when the client accepts it."""
+    body = content.body
+    etag = content.etag
+    headers = {"Cache-Control": CONTENT_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    encoding = choose_encoding(
+        request.headers.get("accept-encoding"), tuple(content.encodings)
+    )
+    if encoding is not None:
+        body = content.encodings[encoding]
+        etag = variant_etag(etag, encoding)
+        headers["Content-Encoding"] = encoding
+    headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or etag_matches(if_none_match, content.etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/chapters")
-async def get_chapters():
-    return chapters_data
+async def get_chapters(request: Request):
+    return content_response(request, content_snapshot.chapters_content)
 
 
 @app.get("/api/chapters/{chapter_id}")
-async def get_chapter(chapter_id: str):
-    index_file = os.path.join(DATA_DIR, f"chapter_{chapter_id}", "index.json")
-    if os.path.exists(index_file):
-        with open(index_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+async def get_chapter(request: Request, chapter_id: str):
+    content = await content_snapshot.content_cache.chapter(chapter_id)
+    if content is not None:
+        return content_response(request, content)
     return {"error": "Chapter not found"}
 
 
 @app.get("/api/chapters/{chapter_id}/lessons/{lesson_id}")
-async def get_lesson(chapter_id: str, lesson_id: str):
-    lesson_file = os.path.join(
-        DATA_DIR, f"chapter_{chapter_id}", f"lesson_{lesson_id}.json"
-    )
-    if os.path.exists(lesson_file):
-        with open(lesson_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+async def get_lesson(request: Request, chapter_id: str, lesson_id: str):
+    content = await content_snapshot.content_cache.lesson(chapter_id, lesson_id)
+    if content is not None:
+        return content_response(request, content)
     return {"error": "Lesson not found"}
 
 
-import random
-
-
-@app.get("/api/questions")
+@app.get("/api/questions", dependencies=[Depends(resolve_user)])
 async def get_questions(
     request: Request,
     chapter_id: Optional[str] = None,
@@ -259,45 +833,123 @@ async def get_questions(
     difficulty: Optional[int] = None,
     wrong_only: Optional[bool] = None,
     reviewed_only: Optional[bool] = False,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    seed: Optional[int] = None,
 ):
-    questions = questions_data.get("questions", [])
+    """A random sample of 20 matching questions, or, when ``cursor``,
+    ``limit`` or ``seed`` is given, one page of all of them.
 
+    Pages follow an order shuffled by ``seed`` (random if omitted); pass the
+    returned ``next_cursor`` with the same filters to get the next page.
+    Samples only draw from lessons the user completed, pages cover every
+    question matching the filters.
+    """
+    paginate = cursor is not None or limit is not None or seed is not None
+    after = None
+    if cursor is not None:
+        try:
+            seed, after = decode_question_cursor(cursor)
+        except ValueError:
+            return FastJSONResponse(
+                {"success": False, "error": "Invalid cursor"}, status_code=400
+            )
     user_data = request.state.user_data
-    completed_lessons = set()
-    lessons = user_data.get("progress", {}).get("lessons", {})
-    for lesson_id in lessons.keys():
-        completed_lessons.add(lesson_id)
-
-    if completed_lessons:
-        questions = [
-            q
-            for q in questions
-            if q.get("id", "").replace("ex_", "").rsplit("_", 1)[0] in completed_lessons
-        ]
+    progress = user_data.get("progress", {})
+    completed_lessons = None
+    if not paginate:
+        completed_lessons = progress.get("lessons", {}).keys() or None
 
+    wrong_question_ids = None
     if wrong_only:
-        question_states = user_data.get("progress", {}).get("question_states", {})
+        await ensure_question_states(request.state.user_id, user_data)
         wrong_question_ids = [
-            qid for qid, state in question_states.items() if state.get("wrong", 0) > 0
+            qid
+            for qid, state in progress.get("question_states", {}).items()
+            if state.get("wrong", 0) > 0
         ]
-        questions = [q for q in questions if q.get("id") in wrong_question_ids]
 
-    if chapter_id:
-        questions = [q for q in questions if q.get("chapter_id") == chapter_id]
-    if type:
-        questions = [q for q in questions if q.get("type") == type]
-    if difficulty:
-        questions = [q for q in questions if q.get("difficulty") == difficulty]
+    question_index = content_snapshot.question_index
+    with metrics.time("question_select_seconds"):
+        positions = question_index.select(
+            lessons=completed_lessons,
+            question_ids=wrong_question_ids,
+            chapter_id=chapter_id,
+            type=type,
+            difficulty=difficulty,
+        )
+        total = len(question_index) if positions is None else len(positions)
+        if not paginate:
+            questions = question_index.sample(positions, 20)
+    if not paginate:
+        return FastJSONResponse({"questions": questions, "total": total})
+
+    if seed is None:
+        seed = random.getrandbits(63)
+    limit = max(1, min(limit or QUESTION_PAGE_SIZE, MAX_QUESTION_PAGE_SIZE))
+    # O(matching questions) to order, plus building the ID hashes on first use.
+    with metrics.time("question_page_seconds"):
+        questions, key = await asyncio.to_thread(
+            question_index.page, positions, seed, after, limit
+        )
+    return FastJSONResponse(
+        {
+            "questions": questions,
+            "total": total,
+            "seed": seed,
+            "next_cursor": None if key is None else encode_question_cursor(seed, key),
+        }
+    )
+
+
+def encode_question_cursor(seed, key):
+    return f"{seed:x}.{key:x}"
+
+
+def decode_question_cursor(cursor):
+    seed, key = cursor.split(".")
+    return int(seed, 16), int(key, 16)
 
-    random.shuffle(questions)
 
-    return {"questions": questions[:20], "total": len(questions)}
+@app.get("/api/admin/questions/export")
+async def export_questions(
+    chapter_id: Optional[str] = None,
+    type: Optional[str] = None,
+    difficulty: Optional[int] = None,
+):
+    """Matching questions as NDJSON, in bank order, streamed in batches."""
+    question_index = content_snapshot.question_index
+    positions = question_index.select(
+        chapter_id=chapter_id, type=type, difficulty=difficulty
+    )
+    if positions is None:
+        positions = range(len(question_index))
+    else:
+        positions = sorted(positions)
+
+    # A plain generator is iterated in a worker thread, off the event loop.
+    def lines():
+        batch = []
+        for position in positions:
+            batch.append(question_index.question_json(position))
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield b"\n".join(batch) + b"\n"
+                batch = []
+        if batch:
+            yield b"\n".join(batch) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(len(positions))},
+    )
 
 
-def recover_hearts(user_data):
+def recover_hearts(user_data, now=None):
     MAX_HEARTS = 5
     RECOVERY_MINUTES = 10
 
+    now = now or datetime.now()
     last_recovery = user_data["profile"].get("last_heart_recovery")
     current_hearts = user_data["profile"].get("lives", 5)
 
@@ -306,11 +958,11 @@ def recover_hearts(user_data):
 
     if last_recovery is None:
         user_data["profile"]["lives"] = MAX_HEARTS
-        user_data["profile"]["last_heart_recovery"] = datetime.now().isoformat()
+        user_data["profile"]["last_heart_recovery"] = now.isoformat()
         return MAX_HEARTS
 
     last_recovery_time = datetime.fromisoformat(last_recovery)
-    elapsed = datetime.now() - last_recovery_time
+    elapsed = now - last_recovery_time
     minutes_elapsed = elapsed.total_seconds() / 60
 
     hearts_to_recover = int(minutes_elapsed / RECOVERY_MINUTES)
@@ -318,53 +970,16 @@ def recover_hearts(user_data):
 
     if new_hearts > current_hearts:
         user_data["profile"]["lives"] = new_hearts
-        user_data["profile"]["last_heart_recovery"] = datetime.now().isoformat()
+        user_data["profile"]["last_heart_recovery"] = now.isoformat()
 
     return new_hearts
 
 
-@app.get("/api/user/profile")
-async def get_user_profile(request: Request):
-    user_data = request.state.user_data
-    recover_hearts(user_data)
-    return user_data.get("profile", {})
-
-
-@app.get("/api/user/progress")
-async def get_user_progress(request: Request):
-    user_data = request.state.user_data
-    return user_data.get("progress", {})
-
-
-@app.post("/api/user/lesson/complete")
-async def complete_lesson(request: Request, data: dict):
-    user_data = request.state.user_data
-    user_id = request.state.user_id
-    lesson_id = data.get("lesson_id")
-    score = data.get("score", 100)
-    xp_earned = data.get("xp_earned", 20)
-
-    if "lessons" not in user_data["progress"]:
-        user_data["progress"]["lessons"] = {}
-
-    if lesson_id not in user_data["progress"]["lessons"]:
-        user_data["progress"]["lessons"][lesson_id] = {}
-
-    user_data["progress"]["lessons"][lesson_id].update(
-        {
-            "completed_at": datetime.now().isoformat(),
-            "score": score,
-            "xp_earned": xp_earned,
-        }
-    )
-
-    user_data["profile"]["xp"] += xp_earned
-    user_data["progress"]["statistics"]["total_xp_earned"] += xp_earned
-    user_data["progress"]["statistics"]["today_xp"] += xp_earned
-    user_data["progress"]["statistics"]["lessons_completed"] += 1
-
-    today = datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+def touch_activity_day(user_data, now):
+    """Return the daily_activity entry for ``now``, extending the streak on
+    the first activity of the day."""
+    today = now.strftime("%Y-%m-%d")
+    yesterday = (now - timedelta(days=1)).strftime("%Y-%m-%d")
 
     if today not in user_data["progress"]["daily_activity"]:
         user_data["progress"]["daily_activity"][today] = {
@@ -373,14 +988,16 @@ async def complete_lesson(request: Request, data: dict):
             "questions_answered": 0,
             "streak_active": False,
         }
-    user_data["progress"]["daily_activity"][today]["xp_earned"] += xp_earned
-    user_data["progress"]["daily_activity"][today]["lessons_completed"] += 1
+    activity = user_data["progress"]["daily_activity"][today]
 
-    if not user_data["progress"]["daily_activity"][today].get("streak_active", False):
-        user_data["progress"]["daily_activity"][today]["streak_active"] = True
+    if not activity.get("streak_active", False):
+        activity["streak_active"] = True
 
         last_active = user_data["profile"].get("last_active_date")
 
+        if last_active is not None and today < last_active:
+            # Backdated answer from an offline queue: the streak has moved on.
+            return activity
         if last_active is None:
             user_data["profile"]["streak"] = 1
         elif last_active == yesterday:
@@ -390,39 +1007,12 @@ async def complete_lesson(request: Request, data: dict):
 
         user_data["profile"]["last_active_date"] = today
 
-    daily_lessons = user_data["progress"]["daily_activity"][today]["lessons_completed"]
-    if daily_lessons > user_data["progress"]["statistics"].get("max_daily_lessons", 0):
-        user_data["progress"]["statistics"]["max_daily_lessons"] = daily_lessons
+    return activity
 
-    if score == 100:
-        user_data["progress"]["statistics"]["perfect_lessons"] = (
-            user_data["progress"]["statistics"].get("perfect_lessons", 0) + 1
-        )
 
-    current_streak = user_data["profile"]["streak"]
-    if current_streak > user_data["progress"]["statistics"].get("max_streak", 0):
-        user_data["progress"]["statistics"]["max_streak"] = current_streak
-
-    if "achievements" not in user_data["progress"]:
-        user_data["progress"]["achievements"] = []
-
-    save_user_data(user_id)
-    return {
-        "success": True,
-        "xp_earned": xp_earned,
-        "total_xp": user_data["profile"]["xp"],
-        "streak": user_data["profile"]["streak"],
-    }
-
-
-@app.post("/api/user/answer")
-async def submit_answer(request: Request, data: dict):
-    user_data = request.state.user_data
-    user_id = request.state.user_id
-    recover_hearts(user_data)
-
-    question_id = data.get("question_id")
-    is_correct = data.get("is_correct", False)
+def apply_answer(user_data, question_id, is_correct, now):
+    """Record one answer; returns the rows it touched for mark_user_dirty."""
+    recover_hearts(user_data, now)
 
     if "question_states" not in user_data["progress"]:
         user_data["progress"]["question_states"] = {}
@@ -439,51 +1029,102 @@ async def submit_answer(request: Request, data: dict):
     else:
         user_data["progress"]["question_states"][question_id]["wrong"] += 1
         user_data["profile"]["lives"] = max(0, user_data["profile"].get("lives", 5) - 1)
+    schedule(user_data["progress"]["question_states"][question_id], is_correct, now)
 
     user_data["progress"]["statistics"]["total_questions_answered"] += 1
     if is_correct:
         user_data["progress"]["statistics"]["total_correct_answers"] += 1
 
-    today = datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-
-    if today not in user_data["progress"]["daily_activity"]:
-        user_data["progress"]["daily_activity"][today] = {
-            "xp_earned": 0,
-            "lessons_completed": 0,
-            "questions_answered": 0,
-            "streak_active": False,
-        }
-    user_data["progress"]["daily_activity"][today]["questions_answered"] += 1
+    activity = touch_activity_day(user_data, now)
+    activity["questions_answered"] += 1
     if is_correct:
-        user_data["progress"]["daily_activity"][today]["xp_earned"] += 2
+        activity["xp_earned"] += 2
 
-    if not user_data["progress"]["daily_activity"][today].get("streak_active", False):
-        user_data["progress"]["daily_activity"][today]["streak_active"] = True
+    return [
+        ("question_states", question_id),
+        ("daily_activity", now.strftime("%Y-%m-%d")),
+    ]
 
-        last_active = user_data["profile"].get("last_active_date")
 
-        if last_active is None:
-            user_data["profile"]["streak"] = 1
-        elif last_active == yesterday:
-            user_data["profile"]["streak"] = user_data["profile"].get("streak", 0) + 1
+def parse_client_time(value, now):
+    """Parse an answer timestamp (epoch milliseconds or ISO 8601).
+
+    Missing or malformed values fall back to ``now`` and future times are
+    clamped to it, so clients cannot bank hearts or streak days ahead.
+    Times more than ANSWER_MAX_AGE old also count as ``now``, so a
+    backdated answer cannot fill in streak days that were missed.
+    """
+    try:
+        if isinstance(value, (int, float)):
+            answered_at = datetime.fromtimestamp(value / 1000)
+        elif isinstance(value, str):
+            answered_at = datetime.fromisoformat(value)
+            if answered_at.tzinfo is not None:
+                answered_at = answered_at.astimezone().replace(tzinfo=None)
         else:
-            user_data["profile"]["streak"] = 1
+            return now
+    except (ValueError, OverflowError, OSError):
+        return now
+    if answered_at < now - ANSWER_MAX_AGE:
+        return now
+    return min(answered_at, now)
 
-        user_data["profile"]["last_active_date"] = today
 
-    save_user_data(user_id)
-    return {
-        "success": True,
-        "lives": user_data["profile"]["lives"],
-        "xp": user_data["profile"]["xp"],
-    }
+def apply_lesson_completion(user_data, lesson_id, score, xp_earned, now):
+    if "lessons" not in user_data["progress"]:
+        user_data["progress"]["lessons"] = {}
 
+    previous = user_data["progress"]["lessons"].get(lesson_id)
+    if previous is not None:
+        previous = dict(previous)
+    else:
+        user_data["progress"]["lessons"][lesson_id] = {}
 
-@app.post("/api/user/reset-progress")
-async def reset_progress(request: Request):
-    user_data = request.state.user_data
-    user_id = request.state.user_id
+    user_data["progress"]["lessons"][lesson_id].update(
+        {
+            "completed_at": now.isoformat(),
+            "score": score,
+            "xp_earned": xp_earned,
+        }
+    )
+
+    user_data["profile"]["xp"] += xp_earned
+    user_data["progress"]["statistics"]["total_xp_earned"] += xp_earned
+    user_data["progress"]["statistics"]["today_xp"] += xp_earned
+    user_data["progress"]["statistics"]["lessons_completed"] += 1
+
+    chapter_progress = user_data["progress"].setdefault("chapter_progress", {})
+    record_lesson(chapter_progress, lesson_id, previous, xp_earned)
+    user_data["progress"]["statistics"]["chapters_completed"] = (
+        count_completed_chapters(
+            chapter_progress, content_snapshot.chapters_data.get("chapters", [])
+        )
+    )
+
+    activity = touch_activity_day(user_data, now)
+    activity["xp_earned"] += xp_earned
+    activity["lessons_completed"] += 1
+
+    daily_lessons = activity["lessons_completed"]
+    if daily_lessons > user_data["progress"]["statistics"].get("max_daily_lessons", 0):
+        user_data["progress"]["statistics"]["max_daily_lessons"] = daily_lessons
+
+    if score == 100:
+        user_data["progress"]["statistics"]["perfect_lessons"] = (
+            user_data["progress"]["statistics"].get("perfect_lessons", 0) + 1
+        )
+
+    current_streak = user_data["profile"]["streak"]
+    if current_streak > user_data["progress"]["statistics"].get("max_streak", 0):
+        user_data["progress"]["statistics"]["max_streak"] = current_streak
+
+    if "achievements" not in user_data["progress"]:
+        user_data["progress"]["achievements"] = []
+
+    return [("lessons", lesson_id), ("daily_activity", now.strftime("%Y-%m-%d"))]
+
+
+def apply_reset(user_data):
     user_data["profile"]["xp"] = 0
     user_data["profile"]["level"] = 1
     user_data["profile"]["streak"] = 0
@@ -491,7 +1132,10 @@ async def reset_progress(request: Request):
     user_data["profile"]["last_active_date"] = None
     user_data["profile"]["last_heart_recovery"] = None
     user_data["progress"]["lessons"] = {}
-    user_data["progress"]["question_states"] = {}
+    user_data["progress"]["question_states"] = compact_question_states(
+        {}, content_snapshot.question_ordinals
+    )
+    user_data["progress"]["chapter_progress"] = {}
     user_data["progress"]["achievements"] = []
     user_data["progress"]["statistics"] = {
         "total_questions_answered": 0,
@@ -504,7 +1148,315 @@ async def reset_progress(request: Request):
         "max_daily_lessons": 0,
         "perfect_lessons": 0,
     }
-    save_user_data(user_id)
+    return None
+
+
+def with_activity_rollup(mutate):
+    """Wrap ``mutate`` to roll up old daily_activity on a user's first
+    change of the day, adding the removed days to its changes."""
+
+    def apply(user_data):
+        progress = user_data["progress"]
+        now = datetime.now()
+        rolled = []
+        if now.strftime("%Y-%m-%d") not in progress.get("daily_activity", {}):
+            rolled = roll_up_daily_activity(
+                progress, now, DAILY_ACTIVITY_WINDOW_DAYS
+            )
+        changes = mutate(user_data)
+        if not rolled or changes is None:
+            return changes
+        return [
+            *(changes or ()),
+            *(("daily_activity", day) for day in rolled),
+        ]
+
+    return apply
+
+
+def bump_revision(user_data, changes):
+    """Give a changed document its next revision and log what changed."""
+    revision = user_data.get("revision", 0) + 1
+    user_data["revision"] = revision
+    record_changes(
+        user_data["progress"], revision, changes, PROGRESS_CHANGE_LOG_KEYS
+    )
+
+
+async def mutate_user(request, mutate):
+    """Apply ``mutate(user_data)`` to the current user and persist it.
+
+    ``mutate`` returns the changes for mark_user_dirty, or False when it left
+    the document untouched. Returns the document that was updated, which in
+    shared-state mode may be a fresher copy than ``request.state.user_data``.
+    """
+    user_id = request.state.user_id
+    user_data = request.state.user_data
+    mutate = with_activity_rollup(mutate)
+    if not SHARED_STATE:
+        changes = mutate(user_data)
+        if changes is not False:
+            bump_revision(user_data, changes)
+            mark_user_dirty(user_id, changes)
+            leaderboard.update(user_id, user_data)
+        return user_data
+
+    # Shared state: write through with an optimistic revision check so other
+    # workers' updates are never overwritten; on conflict reload and re-apply.
+    for _attempt in range(SHARED_STATE_MAX_RETRIES):
+        expected = user_data.get("revision", 0)
+        changes = mutate(user_data)
+        if changes is False:
+            return user_data
+        bump_revision(user_data, changes)
+        payload = progress_store.prepare([(user_id, user_data, changes)])
+        if await asyncio.to_thread(
+            progress_store.write_if_revision, user_id, expected, payload
+        ):
+            leaderboard.update(user_id, user_data)
+            return user_data
+        user_progress_cache.pop(user_id)
+        had_states = user_data["progress"].get("question_states") is not UNLOADED
+        user_data = await load_user_data(user_id)
+        if had_states:
+            await ensure_question_states(user_id, user_data)
+        request.state.user_data = user_data
+    raise RuntimeError(f"Too many concurrent updates for user {user_id}")
+
+
+@app.get("/api/user/profile", dependencies=[Depends(resolve_user)])
+async def get_user_profile(request: Request):
+    def recover(user_data):
+        lives = user_data["profile"].get("lives", 5)
+        return () if recover_hearts(user_data) != lives else False
+
+    user_data = await mutate_user(request, recover)
+    return user_data.get("profile", {})
+
+
+@app.get("/api/user/progress", dependencies=[Depends(resolve_user)])
+async def get_user_progress(request: Request, since: Optional[int] = None):
+    """The progress document with its ``revision``; with ``since``, only the
+    rows changed after that revision (or everything, marked ``full``)."""
+    user_data = request.state.user_data
+    progress = user_data.get("progress", {})
+    revision = user_data.get("revision", 0)
+    if since is None or needs_question_states(progress, since, revision):
+        await ensure_question_states(request.state.user_id, user_data)
+    if since is None:
+        return FastJSONResponse(progress_document(progress, revision))
+    return FastJSONResponse(progress_delta(progress, since, revision))
+
+
+@app.get("/api/user/summary", dependencies=[Depends(resolve_user)])
+async def get_user_summary(request: Request):
+    """Profile, course and per-chapter progress for the home screen, from
+    the incremental chapter rollups rather than the full progress document."""
+    user_data = request.state.user_data
+    return FastJSONResponse(
+        summarize_progress(user_data, content_snapshot.chapters_data)
+    )
+
+
+@app.post("/api/user/lesson/complete", dependencies=[Depends(resolve_user)])
+async def complete_lesson(request: Request, data: dict):
+    lesson_id = data.get("lesson_id")
+    if not isinstance(lesson_id, str) or not lesson_id:
+        return FastJSONResponse(
+            {"success": False, "error": "lesson_id must be a non-empty string"},
+            status_code=400,
+        )
+    score = data.get("score", 100)
+    if (
+        not isinstance(score, int)
+        or isinstance(score, bool)
+        or not 0 <= score <= 100
+    ):
+        return FastJSONResponse(
+            {"success": False, "error": "score must be an integer from 0 to 100"},
+            status_code=400,
+        )
+    xp_earned = data.get("xp_earned", 20)
+    if not isinstance(xp_earned, int) or isinstance(xp_earned, bool):
+        return FastJSONResponse(
+            {"success": False, "error": "xp_earned must be an integer"},
+            status_code=400,
+        )
+    # XP is reported by the client; keep one request from minting unbounded XP.
+    xp_earned = max(0, min(xp_earned, MAX_LESSON_XP))
+    now = datetime.now()
+
+    user_data = await mutate_user(
+        request,
+        lambda user_data: apply_lesson_completion(
+            user_data, lesson_id, score, xp_earned, now
+        ),
+    )
+    return {
+        "success": True,
+        "xp_earned": xp_earned,
+        "total_xp": user_data["profile"]["xp"],
+        "streak": user_data["profile"]["streak"],
+    }
+
+
+def record_question_stats(answers):
+    question_index = content_snapshot.question_index
+    for question_id, is_correct in answers:
+        # Only bank questions, so made-up IDs cannot grow the counters.
+        if (
+            isinstance(question_id, str)
+            and question_index.position_of(question_id) is not None
+        ):
+            question_stats.record(question_id, bool(is_correct))
+
+
+def answer_error(answer):
+    """Why an answer object cannot be applied, or None if it can."""
+    if not isinstance(answer, dict):
+        return "an answer must be an object"
+    question_id = answer.get("question_id")
+    if not isinstance(question_id, str) or not question_id:
+        return "question_id must be a non-empty string"
+    if not isinstance(answer.get("is_correct", False), bool):
+        return "is_correct must be a boolean"
+    return None
+
+
+@app.post("/api/user/answer", dependencies=[Depends(resolve_user)])
+async def submit_answer(request: Request, data: dict):
+    error = answer_error(data)
+    if error is not None:
+        return FastJSONResponse({"success": False, "error": error}, status_code=400)
+    question_id = data.get("question_id")
+    is_correct = data.get("is_correct", False)
+    now = datetime.now()
+    await ensure_question_states(request.state.user_id, request.state.user_data)
+
+    user_data = await mutate_user(
+        request,
+        lambda user_data: apply_answer(user_data, question_id, is_correct, now),
+    )
+    record_question_stats([(question_id, is_correct)])
+    review_index.update(
+        request.state.user_id,
+        user_data["progress"]["question_states"],
+        [question_id],
+    )
+    return {
+        "success": True,
+        "lives": user_data["profile"]["lives"],
+        "xp": user_data["profile"]["xp"],
+    }
+
+
+MAX_ANSWER_BATCH = 200
+
+
+@app.post("/api/user/answers", dependencies=[Depends(resolve_user)])
+async def submit_answers(request: Request, data: dict):
+    """Apply a queued practice session in one round trip.
+
+    Body: ``{"answers": [{"question_id", "is_correct", "answered_at"}, ...]}``
+    with ``answered_at`` as epoch milliseconds or ISO 8601. Answers are
+    applied in the order given, exactly as /api/user/answer would.
+    """
+    answers = data.get("answers")
+    if not isinstance(answers, list):
+        return FastJSONResponse(
+            {"success": False, "error": "answers must be a list"}, status_code=400
+        )
+    if len(answers) > MAX_ANSWER_BATCH:
+        return FastJSONResponse(
+            {
+                "success": False,
+                "error": f"At most {MAX_ANSWER_BATCH} answers per batch",
+            },
+            status_code=400,
+        )
+    # Check every answer first: a bad one must not leave earlier ones applied.
+    for i, answer in enumerate(answers):
+        error = answer_error(answer)
+        if error is not None:
+            return FastJSONResponse(
+                {"success": False, "error": f"answers[{i}]: {error}"},
+                status_code=400,
+            )
+
+    now = datetime.now()
+    await ensure_question_states(request.state.user_id, request.state.user_data)
+
+    def apply_all(user_data):
+        changes = set()
+        for answer in answers:
+            changes.update(
+                apply_answer(
+                    user_data,
+                    answer.get("question_id"),
+                    answer.get("is_correct", False),
+                    parse_client_time(answer.get("answered_at"), now),
+                )
+            )
+        return changes
+
+    user_data = await mutate_user(request, apply_all)
+    record_question_stats(
+        (answer.get("question_id"), answer.get("is_correct", False))
+        for answer in answers
+    )
+    review_index.update(
+        request.state.user_id,
+        user_data["progress"]["question_states"],
+        {answer.get("question_id") for answer in answers},
+    )
+    return {
+        "success": True,
+        "applied": len(answers),
+        "lives": user_data["profile"]["lives"],
+        "xp": user_data["profile"]["xp"],
+    }
+
+
+@app.get("/api/review", dependencies=[Depends(resolve_user)])
+async def get_review(request: Request, limit: int = 20):
+    """Questions due for spaced-repetition review, most overdue first."""
+    user_data = request.state.user_data
+    limit = max(1, min(limit, 100))
+    await ensure_question_states(request.state.user_id, user_data)
+    question_ids = review_index.due(
+        request.state.user_id,
+        user_data["progress"].get("question_states", {}),
+        datetime.now(),
+        limit,
+    )
+    question_index = content_snapshot.question_index
+    questions = []
+    for question_id in question_ids:
+        position = question_index.position_of(question_id)
+        if position is not None:
+            questions.append(question_index.questions[position])
+    return FastJSONResponse({"questions": questions})
+
+
+@app.get("/api/leaderboard", dependencies=[Depends(resolve_user)])
+async def get_leaderboard(request: Request, board: str = "xp", limit: int = 10):
+    """Top ``limit`` players on a board plus the caller's own rank."""
+    if board not in BOARDS:
+        return FastJSONResponse(
+            {"success": False, "error": f"board must be one of {', '.join(BOARDS)}"},
+            status_code=400,
+        )
+    limit = max(1, min(limit, 100))
+    return FastJSONResponse(
+        leaderboard.standings(board, request.state.user_id, limit)
+    )
+
+
+@app.post("/api/user/reset-progress", dependencies=[Depends(resolve_user)])
+async def reset_progress(request: Request):
+    await mutate_user(request, apply_reset)
+    # The old heap still references the discarded question_states.
+    review_index.forget(request.state.user_id)
     return {"success": True}
 
 
@@ -0,0 +1,249 @@
+"""Prometheus-style counters and histograms, plus a sampling profiler.
+
+Everything is off unless METRICS=1: ``metrics.inc``/``observe`` return
+immediately, ``metrics.time`` hands back a shared no-op context manager and
+no request middleware is installed. Update metrics from the event loop
+thread only (time ``await asyncio.to_thread(...)`` around the call rather
+than inside the worker).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+PREFIX = "cpa_"
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+_NO_TIMER = nullcontext()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, elapsed, **self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.counters = {}
+        # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        series = self.histograms.get(key)
+        if series is None:
+            series = self.histograms[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[-2] += 1
+        series[-1] += value
+
+    def time(self, name, **labels):
+        """Context manager observing the elapsed seconds into ``name``."""
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, name, labels)
+
+    def register_collector(self, collect):
+        """``collect()`` yields ``(name, type, labels_dict, value)`` samples
+        computed at scrape time, e.g. cache sizes."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            declare(name, "counter")
+            lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+
+        for (name, labels), series in sorted(self.histograms.items()):
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f"{PREFIX}{name}_bucket{_labels_text(labels, ('le', bound))} "
+                    f"{cumulative}"
+                )
+            cumulative += series[-2]
+            lines.append(
+                f"{PREFIX}{name}_bucket{_labels_text(labels, ('le', '+Inf'))} "
+                f"{cumulative}"
+            )
+            lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {series[-1]}")
+            lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {cumulative}")
+
+        for collect in self.collectors:
+            for name, kind, labels, value in collect():
+                declare(name, kind)
+                lines.append(
+                    f"{PREFIX}{name}{_labels_text(sorted(labels.items()))} {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording per-route latency and status counts."""
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Route templates, not raw paths, keep label cardinality bounded.
+            path = getattr(route, "path", "unmatched")
+            self.metrics.observe(
+                "http_request_duration_seconds",
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=path,
+            )
+            self.metrics.inc(
+                "http_requests_total",
+                method=scope["method"],
+                route=path,
+                status=status,
+            )
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every ``interval`` seconds.
+
+    Results are folded stacks (``outer;inner count``) that flamegraph tools
+    read directly. Nothing runs until ``start`` is called.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = Counter()
+        self.started_at = None
+        self.interval = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id, interval=0.005):
+        if self.running:
+            return False
+        self.samples = Counter()
+        self.interval = interval
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(thread_id,), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def _run(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def report(self, limit=200):
+        # dict() copies atomically, so this is safe while the sampler runs.
+        samples = Counter(dict(self.samples))
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "started_at": self.started_at,
+            "total_samples": sum(samples.values()),
+            "stacks": [f"{stack} {count}" for stack, count in samples.most_common(limit)],
+        }
+
+
+metrics = Metrics(os.environ.get("METRICS", "0") == "1")
+profiler = SamplingProfiler()
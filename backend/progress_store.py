@@ -0,0 +1,934 @@
+#!/usr/bin/env python3
+"""Storage backends for per-user progress documents.
+
+A user document is the dict served by the API:
+``{"profile": {...}, "progress": {"lessons": {...}, "question_states": {...},
+"daily_activity": {...}, ...}}``.
+
+``save``/``save_many`` accept an optional ``changes`` set of
+``(section, key)`` pairs naming the rows touched since the last save, e.g.
+``("question_states", "ex_1_1_3")``. ``None`` means the whole document must
+be rewritten. Stores that cannot write partially simply ignore it.
+
+Saving is split into ``prepare`` (snapshot the documents into a payload, done
+on the event loop so no handler mutates them mid-serialization) and ``write``
+(blocking I/O, safe to run in a worker thread). ``write`` returns the IDs of
+users whose documents the store rejected; those users are left as stored
+and the rest of the batch is still written.
+
+``question_states``, the one section that grows without bound, can be left
+out of a load with ``lazy=True``: it is then the UNLOADED placeholder until
+``load_section`` fetches it, and saving a document that still holds the
+placeholder keeps the stored states as they are.
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from atomic_file import atomic_write
+from compact_state import expand_question_states, load_question_ordinals
+from user_archive import UserArchive
+
+ROW_SECTIONS = ("lessons", "question_states", "daily_activity")
+# Delta-sync log in the progress document (see change_log.py).
+CHANGE_LOG_KEY = "change_log"
+LAZY_SECTIONS = ("question_states",)
+
+
+class UnloadedSection:
+    """Stands in for a section that was not read from the store.
+
+    It is deliberately not a mapping, so code that forgets to load the
+    section fails loudly instead of writing an empty one back.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<unloaded section>"
+
+
+UNLOADED = UnloadedSection()
+
+
+class ProgressStore:
+    def load(self, user_id, lazy=False):
+        """Return the stored document, or None if the user is unknown.
+
+        With ``lazy`` the LAZY_SECTIONS are UNLOADED.
+        """
+        raise NotImplementedError
+
+    def load_section(self, user_id, section):
+        """The stored value of one LAZY_SECTIONS section ({} if none)."""
+        raise NotImplementedError
+
+    def save(self, user_id, data, changes=None):
+        self.save_many([(user_id, data, changes)])
+
+    def save_many(self, items):
+        return self.write(self.prepare(items))
+
+    def prepare(self, items):
+        raise NotImplementedError
+
+    def write(self, payload):
+        """Write a prepared payload; returns the user IDs it rejected."""
+        raise NotImplementedError
+
+    def payload_bytes(self, payload):
+        """Size of a prepared payload in bytes, or None if not meaningful."""
+        return None
+
+    def load_question_stats(self):
+        """Return ``{question_id: (attempts, correct)}`` across all users."""
+        raise NotImplementedError
+
+    def add_question_stats(self, deltas):
+        """Add ``{question_id: [attempts, correct]}`` to the totals."""
+        raise NotImplementedError
+
+    def replace_question_stats(self, totals):
+        raise NotImplementedError
+
+    def leaderboard_rows(self, since_day):
+        """Yield ``(user_id, xp, xp_since, streak, last_active_date)`` for
+        every stored user, where xp_since sums daily XP from since_day on."""
+        raise NotImplementedError
+
+    def archive_idle_users(self, idle_days, skip=()):
+        """Pack users idle for ``idle_days`` into archives; returns how many.
+
+        Stores that already keep every user in one file have nothing to do.
+        """
+        return 0
+
+    def close(self):
+        pass
+
+
+def read_user_document(f, lazy=False):
+    """Parse a stored JSON document from the binary file ``f``.
+
+    Documents are the core (everything but LAZY_SECTIONS) on the first line
+    and question_states on the second, so a lazy load parses only the
+    first line. Single-document files from older versions are read whole.
+    """
+    head = f.readline()
+    try:
+        data = json.loads(head)
+    except ValueError:
+        # Pretty-printed by an older version.
+        data = json.loads(head + f.read())
+    if not isinstance(data, dict):
+        raise ValueError("Not a progress document")
+    progress = data.setdefault("progress", {})
+    if "question_states" in progress:
+        return data
+    if lazy:
+        progress["question_states"] = UNLOADED
+    else:
+        tail = f.read().strip()
+        progress["question_states"] = json.loads(tail) if tail else {}
+    return data
+
+
+def read_user_section(f, section):
+    head = f.readline()
+    try:
+        data = json.loads(head)
+    except ValueError:
+        data = json.loads(head + f.read())
+    progress = data.get("progress", {})
+    if section in progress:
+        return progress[section]
+    tail = f.read().strip()
+    return json.loads(tail) if tail else {}
+
+
+class JsonFileStore(ProgressStore):
+    """One JSON document per user under ``user_dir``.
+
+    Users archived by ``archive_idle_users`` are read from their shard in
+    ``archive_dir`` until their next save writes a live file again.
+    """
+
+    def __init__(self, user_dir, json_default=None, archive_shards=64):
+        self.user_dir = user_dir
+        # Lets callers serialize non-JSON resident types (compact states).
+        self.json_default = json_default
+        # Next to (not inside) user_dir, so it is never mistaken for a user.
+        parent = os.path.dirname(os.path.abspath(user_dir))
+        self.stats_path = os.path.join(parent, "question_stats.json")
+        self.archive = UserArchive(
+            os.path.join(parent, "user_archive"), archive_shards
+        )
+        self._stats_lock = threading.Lock()
+        # Orders document writes against archival deleting the live files.
+        self._files_lock = threading.Lock()
+
+    def path_for(self, user_id):
+        return os.path.join(self.user_dir, f"{user_id}.json")
+
+    def _open(self, user_id):
+        """Binary file object for the live or archived document, or None."""
+        try:
+            return open(self.path_for(user_id), "rb")
+        except FileNotFoundError:
+            # The archive shard is in place before live files are removed.
+            body = self.archive.read(user_id)
+            return None if body is None else io.BytesIO(body)
+
+    def load(self, user_id, lazy=False):
+        f = self._open(user_id)
+        if f is None:
+            return None
+        with f:
+            return read_user_document(f, lazy)
+
+    def load_section(self, user_id, section):
+        f = self._open(user_id)
+        if f is None:
+            return {}
+        with f:
+            return read_user_section(f, section)
+
+    def _encode(self, data):
+        body = json.dumps(data, ensure_ascii=False, default=self.json_default)
+        return body.encode("utf-8")
+
+    def prepare(self, items):
+        """``[(user_id, core, states)]``; states is None to keep the stored
+        ones."""
+        payload = []
+        for user_id, data, _changes in items:
+            progress = data.get("progress", {})
+            core = dict(data)
+            core["progress"] = {
+                k: v for k, v in progress.items() if k not in LAZY_SECTIONS
+            }
+            states = progress.get("question_states", {})
+            payload.append(
+                (
+                    user_id,
+                    self._encode(core),
+                    None if states is UNLOADED else self._encode(states),
+                )
+            )
+        return payload
+
+    def _stored_states(self, user_id):
+        f = self._open(user_id)
+        if f is None:
+            return b"{}"
+        with f:
+            return self._encode(read_user_section(f, "question_states"))
+
+    def _write_file(self, path, body):
+        with atomic_write(path) as f:
+            f.write(body)
+
+    def write(self, payload):
+        rejected = []
+        for user_id, core, states in payload:
+            try:
+                with self._files_lock:
+                    if states is None:
+                        states = self._stored_states(user_id)
+                    self._write_file(self.path_for(user_id), core + b"\n" + states)
+            except (OSError, ValueError):
+                # One unwritable file (or unreadable stored states) must not
+                # cost the rest of the batch.
+                rejected.append(user_id)
+        return rejected
+
+    def payload_bytes(self, payload):
+        return sum(
+            len(core) + len(states or b"") for _user_id, core, states in payload
+        )
+
+    def load_question_stats(self):
+        if not os.path.exists(self.stats_path):
+            return {}
+        with open(self.stats_path, "r", encoding="utf-8") as f:
+            return {qid: tuple(counts) for qid, counts in json.load(f).items()}
+
+    def add_question_stats(self, deltas):
+        with self._stats_lock:
+            totals = {qid: list(c) for qid, c in self.load_question_stats().items()}
+            for question_id, (attempts, correct) in deltas.items():
+                counts = totals.setdefault(question_id, [0, 0])
+                counts[0] += attempts
+                counts[1] += correct
+            self._write_file(self.stats_path, json.dumps(totals).encode("utf-8"))
+
+    def replace_question_stats(self, totals):
+        with self._stats_lock:
+            self._write_file(self.stats_path, json.dumps(totals).encode("utf-8"))
+
+    def _live_user_ids(self):
+        if not os.path.isdir(self.user_dir):
+            return
+        for entry in os.scandir(self.user_dir):
+            if entry.name.endswith(".json") and entry.is_file():
+                yield entry.name[: -len(".json")], entry
+
+    def iter_documents(self, lazy=False, errors=None):
+        """Yield ``(user_id, document)`` for every live and archived user.
+
+        Unreadable documents are skipped, and appended to ``errors`` as
+        ``(user_id, exception)`` when it is a list.
+        """
+        live = set()
+        for user_id, entry in self._live_user_ids():
+            live.add(user_id)
+            try:
+                with open(entry.path, "rb") as f:
+                    data = read_user_document(f, lazy)
+            except (OSError, ValueError) as e:
+                if errors is not None:
+                    errors.append((user_id, e))
+                continue
+            yield user_id, data
+        for user_id, body in self.archive.iter_documents():
+            if user_id in live:
+                continue
+            try:
+                data = read_user_document(io.BytesIO(body), lazy)
+            except ValueError as e:
+                if errors is not None:
+                    errors.append((user_id, e))
+                continue
+            yield user_id, data
+
+    def archive_idle_users(self, idle_days, skip=()):
+        """Move users whose file was not written for ``idle_days`` into the
+        archive shards, skipping the user IDs in ``skip``."""
+        cutoff = time.time() - idle_days * 86400
+        by_shard = {}
+        for user_id, entry in self._live_user_ids():
+            if user_id in skip:
+                continue
+            st = entry.stat()
+            if st.st_mtime < cutoff:
+                by_shard.setdefault(self.archive.shard_of(user_id), []).append(
+                    (user_id, entry.path, st.st_mtime_ns)
+                )
+
+        archived = 0
+        for shard, users in sorted(by_shard.items()):
+            documents = {}
+            for user_id, path, _mtime_ns in users:
+                with open(path, "rb") as f:
+                    documents[user_id] = f.read()
+            self.archive.add(
+                shard,
+                documents,
+                lambda user_id: os.path.exists(self.path_for(user_id)),
+            )
+            with self._files_lock:
+                for user_id, path, mtime_ns in users:
+                    try:
+                        if os.stat(path).st_mtime_ns != mtime_ns:
+                            continue  # Written again meanwhile; stays live.
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    archived += 1
+        return archived
+
+    def leaderboard_rows(self, since_day):
+        for user_id, data in self.iter_documents(lazy=True):
+            profile = data.get("profile", {})
+            daily = data.get("progress", {}).get("daily_activity", {})
+            yield (
+                user_id,
+                profile.get("xp", 0),
+                sum(a.get("xp_earned", 0) for d, a in daily.items() if d >= since_day),
+                profile.get("streak", 0),
+                profile.get("last_active_date"),
+            )
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile (
+    user_id TEXT PRIMARY KEY,
+    xp INTEGER NOT NULL DEFAULT 0,
+    level INTEGER NOT NULL DEFAULT 1,
+    streak INTEGER NOT NULL DEFAULT 0,
+    lives INTEGER NOT NULL DEFAULT 5,
+    last_active_date TEXT,
+    last_heart_recovery TEXT,
+    progress_extra TEXT NOT NULL DEFAULT '{}',
+    revision INTEGER NOT NULL DEFAULT 0,
+    change_log_base INTEGER
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    user_id TEXT NOT NULL,
+    lesson_id TEXT NOT NULL,
+    completed_at TEXT,
+    score INTEGER,
+    xp_earned INTEGER,
+    PRIMARY KEY (user_id, lesson_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS question_states (
+    user_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    correct INTEGER NOT NULL DEFAULT 0,
+    wrong INTEGER NOT NULL DEFAULT 0,
+    ef REAL,
+    reps INTEGER,
+    interval INTEGER,
+    due TEXT,
+    PRIMARY KEY (user_id, question_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_activity (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    xp_earned INTEGER NOT NULL DEFAULT 0,
+    lessons_completed INTEGER NOT NULL DEFAULT 0,
+    questions_answered INTEGER NOT NULL DEFAULT 0,
+    streak_active INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS change_log (
+    user_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    key TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    PRIMARY KEY (user_id, section, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+ADDED_COLUMNS = (
+    ("profile", "revision", "INTEGER NOT NULL DEFAULT 0"),
+    ("profile", "change_log_base", "INTEGER"),
+    ("question_states", "ef", "REAL"),
+    ("question_states", "reps", "INTEGER"),
+    ("question_states", "interval", "INTEGER"),
+    ("question_states", "due", "TEXT"),
+)
+
+# Spaced-repetition fields of a question state; NULL when never scheduled.
+SCHEDULE_FIELDS = ("ef", "reps", "interval", "due")
+
+PROFILE_COLUMNS = (
+    "xp",
+    "level",
+    "streak",
+    "lives",
+    "last_active_date",
+    "last_heart_recovery",
+)
+
+
+def _lesson_row(user_id, lesson_id, lesson):
+    return (
+        user_id,
+        lesson_id,
+        lesson.get("completed_at"),
+        lesson.get("score"),
+        lesson.get("xp_earned"),
+    )
+
+
+def _question_state_row(user_id, question_id, state):
+    return (
+        user_id,
+        question_id,
+        state.get("correct", 0),
+        state.get("wrong", 0),
+    ) + tuple(state.get(field) for field in SCHEDULE_FIELDS)
+
+
+def _question_state(correct, wrong, *schedule):
+    state = {"correct": correct, "wrong": wrong}
+    for field, value in zip(SCHEDULE_FIELDS, schedule):
+        if value is not None:
+            state[field] = value
+    return state
+
+
+def _daily_activity_row(user_id, day, activity):
+    return (
+        user_id,
+        day,
+        activity.get("xp_earned", 0),
+        activity.get("lessons_completed", 0),
+        activity.get("questions_answered", 0),
+        int(bool(activity.get("streak_active", False))),
+    )
+
+
+# Errors caused by one user's rows rather than by the database itself.
+REJECTED_ROW_ERRORS = (
+    sqlite3.IntegrityError,
+    sqlite3.DataError,
+    sqlite3.InterfaceError,
+    sqlite3.ProgrammingError,
+    OverflowError,  # Integers beyond SQLite's 64 bits.
+)
+
+ROW_WRITERS = {
+    "lessons": (
+        _lesson_row,
+        "INSERT OR REPLACE INTO lessons VALUES (?, ?, ?, ?, ?)",
+        "DELETE FROM lessons WHERE user_id = ? AND lesson_id = ?",
+    ),
+    "question_states": (
+        _question_state_row,
+        "INSERT OR REPLACE INTO question_states (user_id, question_id, correct, "
+        "wrong, ef, reps, interval, due) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        "DELETE FROM question_states WHERE user_id = ? AND question_id = ?",
+    ),
+    "daily_activity": (
+        _daily_activity_row,
+        "INSERT OR REPLACE INTO daily_activity VALUES (?, ?, ?, ?, ?, ?)",
+        "DELETE FROM daily_activity WHERE user_id = ? AND day = ?",
+    ),
+}
+
+
+class SqliteStore(ProgressStore):
+    """Normalized tables in a single SQLite database running in WAL mode.
+
+    Profile fields get their own columns; the remaining progress keys
+    (statistics, achievements, ...) are kept as JSON in ``progress_extra``.
+    The change log gets its own table so an answer only rewrites the log
+    entries it touched.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            # Several workers may share the file; wait for their write locks.
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                timeout=30,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            # Columns added after the first release of the schema.
+            for table, column, decl in ADDED_COLUMNS:
+                columns = {
+                    row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+                }
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            self._conn = conn
+        return self._conn
+
+    def load(self, user_id, lazy=False):
+        with self._lock:
+            conn = self.conn
+            row = conn.execute(
+                "SELECT xp, level, streak, lives, last_active_date, "
+                "last_heart_recovery, progress_extra, revision, change_log_base "
+                "FROM profile WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            progress = json.loads(row[6])
+            # Logs kept in progress_extra by older versions are dropped;
+            # clients then get one full document.
+            progress.pop(CHANGE_LOG_KEY, None)
+            if row[8] is not None:
+                log_keys = {}
+                for section, key, revision in conn.execute(
+                    "SELECT section, key, revision FROM change_log "
+                    "WHERE user_id = ?",
+                    (user_id,),
+                ):
+                    log_keys.setdefault(section, {})[key] = revision
+                progress[CHANGE_LOG_KEY] = {"base": row[8], "keys": log_keys}
+            progress["lessons"] = {
+                lesson_id: {
+                    "completed_at": completed_at,
+                    "score": score,
+                    "xp_earned": xp_earned,
+                }
+                for lesson_id, completed_at, score, xp_earned in conn.execute(
+                    "SELECT lesson_id, completed_at, score, xp_earned "
+                    "FROM lessons WHERE user_id = ?",
+                    (user_id,),
+                )
+            }
+            if lazy:
+                progress["question_states"] = UNLOADED
+            else:
+                progress["question_states"] = self._question_states(user_id)
+            progress["daily_activity"] = {
+                day: {
+                    "xp_earned": xp_earned,
+                    "lessons_completed": lessons_completed,
+                    "questions_answered": questions_answered,
+                    "streak_active": bool(streak_active),
+                }
+                for (
+                    day,
+                    xp_earned,
+                    lessons_completed,
+                    questions_answered,
+                    streak_active,
+                ) in conn.execute(
+                    "SELECT day, xp_earned, lessons_completed, questions_answered, "
+                    "streak_active FROM daily_activity WHERE user_id = ?",
+                    (user_id,),
+                )
+            }
+        profile = dict(zip(PROFILE_COLUMNS, row[:6]))
+        return {"profile": profile, "progress": progress, "revision": row[7]}
+
+    def _question_states(self, user_id):
+        return {
+            question_id: _question_state(*columns)
+            for question_id, *columns in self.conn.execute(
+                "SELECT question_id, correct, wrong, ef, reps, interval, due "
+                "FROM question_states WHERE user_id = ?",
+                (user_id,),
+            )
+        }
+
+    def load_section(self, user_id, section):
+        if section != "question_states":
+            raise ValueError(f"{section} is not loaded lazily")
+        with self._lock:
+            return self._question_states(user_id)
+
+    def prepare(self, items):
+        """``[(user_id, [(sql, rows), ...]), ...]`` for executemany."""
+        payload = []
+        for user_id, data, changes in items:
+            statements = []
+            self._prepare_user(statements, user_id, data, changes)
+            payload.append((user_id, statements))
+        return payload
+
+    def write(self, payload):
+        """Write every user in one transaction, each under its own savepoint,
+        so rows one user's document cannot store do not roll back the rest."""
+        rejected = []
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_id, statements in payload:
+                    conn.execute("SAVEPOINT user_write")
+                    try:
+                        for sql, rows in statements:
+                            conn.executemany(sql, rows)
+                    except REJECTED_ROW_ERRORS:
+                        conn.execute("ROLLBACK TO user_write")
+                        rejected.append(user_id)
+                    conn.execute("RELEASE user_write")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return rejected
+
+    def _write_statements(self, statements):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    conn.executemany(sql, rows)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def write_if_revision(self, user_id, expected, payload):
+        """Apply ``payload`` only if the stored revision is still ``expected``.
+
+        Returns False without writing when another writer got there first.
+        Unknown users count as revision 0.
+        """
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT revision FROM profile WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if (row[0] if row else 0) != expected:
+                    conn.execute("ROLLBACK")
+                    return False
+                for _user_id, statements in payload:
+                    for sql, rows in statements:
+                        conn.executemany(sql, rows)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return True
+
+    def load_question_stats(self):
+        with self._lock:
+            return {
+                question_id: (attempts, correct)
+                for question_id, attempts, correct in self.conn.execute(
+                    "SELECT question_id, attempts, correct FROM question_stats"
+                )
+            }
+
+    def add_question_stats(self, deltas):
+        self._write_statements(
+            [
+                (
+                    "INSERT INTO question_stats (question_id, attempts, correct) "
+                    "VALUES (?, ?, ?) ON CONFLICT (question_id) DO UPDATE SET "
+                    "attempts = attempts + excluded.attempts, "
+                    "correct = correct + excluded.correct",
+                    [(qid, a, c) for qid, (a, c) in deltas.items()],
+                )
+            ]
+        )
+
+    def replace_question_stats(self, totals):
+        self._write_statements(
+            [
+                ("DELETE FROM question_stats", [()]),
+                (
+                    "INSERT INTO question_stats (question_id, attempts, correct) "
+                    "VALUES (?, ?, ?)",
+                    [(qid, a, c) for qid, (a, c) in totals.items()],
+                ),
+            ]
+        )
+
+    def question_state_totals(self):
+        """Per-question ``[attempts, correct]`` summed over users' states."""
+        with self._lock:
+            return {
+                question_id: [correct + wrong, correct]
+                for question_id, correct, wrong in self.conn.execute(
+                    "SELECT question_id, SUM(correct), SUM(wrong) "
+                    "FROM question_states GROUP BY question_id"
+                )
+            }
+
+    def leaderboard_rows(self, since_day):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT p.user_id, p.xp, COALESCE(SUM(d.xp_earned), 0), "
+                "p.streak, p.last_active_date FROM profile p "
+                "LEFT JOIN daily_activity d ON d.user_id = p.user_id AND d.day >= ? "
+                "GROUP BY p.user_id",
+                (since_day,),
+            ).fetchall()
+
+    def _prepare_user(self, statements, user_id, data, changes):
+        profile = data.get("profile", {})
+        progress = data.get("progress", {})
+        extra = {
+            k: v
+            for k, v in progress.items()
+            if k not in ROW_SECTIONS and k != CHANGE_LOG_KEY
+        }
+        log = progress.get(CHANGE_LOG_KEY)
+        statements.append(
+            (
+                "INSERT OR REPLACE INTO profile (user_id, xp, level, streak, "
+                "lives, last_active_date, last_heart_recovery, progress_extra, "
+                "revision, change_log_base) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        user_id,
+                        profile.get("xp", 0),
+                        profile.get("level", 1),
+                        profile.get("streak", 0),
+                        profile.get("lives", 5),
+                        profile.get("last_active_date"),
+                        profile.get("last_heart_recovery"),
+                        json.dumps(extra, ensure_ascii=False),
+                        data.get("revision", 0),
+                        None if log is None else log["base"],
+                    )
+                ],
+            )
+        )
+        self._prepare_change_log(statements, user_id, log, changes)
+
+        if changes is None:
+            for section in ROW_SECTIONS:
+                if progress.get(section) is UNLOADED:
+                    continue  # Keep the stored rows.
+                make_row, upsert, _delete = ROW_WRITERS[section]
+                statements.append(
+                    (f"DELETE FROM {section} WHERE user_id = ?", [(user_id,)])
+                )
+                statements.append(
+                    (
+                        upsert,
+                        [
+                            make_row(user_id, key, value)
+                            for key, value in progress.get(section, {}).items()
+                        ],
+                    )
+                )
+            return
+
+        for section, key in changes:
+            if section not in ROW_WRITERS or progress.get(section) is UNLOADED:
+                continue
+            make_row, upsert, delete = ROW_WRITERS[section]
+            value = progress.get(section, {}).get(key)
+            if value is None:
+                statements.append((delete, [(user_id, key)]))
+            else:
+                statements.append((upsert, [make_row(user_id, key, value)]))
+
+    def _prepare_change_log(self, statements, user_id, log, changes):
+        upsert = "INSERT OR REPLACE INTO change_log VALUES (?, ?, ?, ?)"
+        if changes is None or log is None:
+            statements.append(
+                ("DELETE FROM change_log WHERE user_id = ?", [(user_id,)])
+            )
+            if log is not None:
+                statements.append(
+                    (
+                        upsert,
+                        [
+                            (user_id, section, key, revision)
+                            for section, keys in log["keys"].items()
+                            for key, revision in keys.items()
+                        ],
+                    )
+                )
+            return
+
+        rows = []
+        for section, key in changes:
+            revision = log["keys"].get(section, {}).get(key)
+            if revision is not None:
+                rows.append((user_id, section, key, revision))
+        if rows:
+            statements.append((upsert, rows))
+            # Entries at or below the base were trimmed from the log.
+            statements.append(
+                (
+                    "DELETE FROM change_log WHERE user_id = ? AND revision <= ?",
+                    [(user_id, log["base"])],
+                )
+            )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_progress_store(kind, user_dir, db_path, json_default=None):
+    if kind == "json":
+        return JsonFileStore(user_dir, json_default)
+    if kind == "sqlite":
+        return SqliteStore(db_path)
+    raise ValueError(f"Unknown progress store: {kind}")
+
+
+def migrate_json_to_sqlite(source_dir, db_path, batch_size=500, ordinals=None):
+    """Bulk-import every user under source_dir, archived ones included,
+    into db_path.
+
+    Packed question_states are expanded with ``ordinals`` (QuestionOrdinals).
+    """
+    source = JsonFileStore(source_dir)
+    target = SqliteStore(db_path)
+    imported = 0
+    failed = 0
+    batch = []
+    errors = []
+
+    def save_batch(batch):
+        rejected = target.save_many(batch)
+        errors.extend((user_id, "rows rejected") for user_id in rejected)
+        return len(batch) - len(rejected)
+
+    try:
+        for user_id, data in source.iter_documents(errors=errors):
+            try:
+                progress = data.get("progress", {})
+                progress["question_states"] = expand_question_states(
+                    progress.get("question_states", {}), ordinals
+                )
+            except Exception as e:
+                print(f"Skipping {user_id}: {e}")
+                failed += 1
+                continue
+            batch.append((user_id, data, None))
+            if len(batch) >= batch_size:
+                imported += save_batch(batch)
+                batch = []
+        if batch:
+            imported += save_batch(batch)
+    finally:
+        target.close()
+    for user_id, e in errors:
+        print(f"Skipping {user_id}: {e}")
+    return imported, failed + len(errors)
+
+
+def main():
+    data_dir = os.path.join(
+        os.path.dirname(__file__), os.environ.get("DATA_DIR", "../data")
+    )
+    parser = argparse.ArgumentParser(description="CPA_PATH progress store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser(
+        "migrate", help="Import per-user JSON files into the SQLite store"
+    )
+    migrate.add_argument(
+        "--source", default=os.path.join(data_dir, "user_progress")
+    )
+    migrate.add_argument(
+        "--db",
+        default=os.environ.get(
+            "PROGRESS_DB_PATH", os.path.join(data_dir, "user_progress.db")
+        ),
+    )
+    migrate.add_argument("--batch-size", type=int, default=500)
+    archive = sub.add_parser(
+        "archive", help="Pack JSON users idle for --days into archive shards"
+    )
+    archive.add_argument(
+        "--source", default=os.path.join(data_dir, "user_progress")
+    )
+    archive.add_argument("--days", type=float, required=True)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        imported, failed = migrate_json_to_sqlite(
+            args.source, args.db, args.batch_size, load_question_ordinals(data_dir)
+        )
+        print(f"Imported {imported} users into {args.db} ({failed} failed)")
+    elif args.command == "archive":
+        # Run it while the API is stopped, or let the API do it with
+        # ARCHIVE_IDLE_DAYS: it knows which users are still in memory.
+        archived = JsonFileStore(args.source).archive_idle_users(args.days)
+        print(f"Archived {archived} users")
+
+
+if __name__ == "__main__":
+    main()
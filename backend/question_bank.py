@@ -0,0 +1,252 @@
+"""Compiled, memory-mappable question bank.
+
+``question_bank.json`` stays the source of truth; ``generate_question_bank.py``
+also writes ``question_bank.bin`` so workers can open the bank without parsing
+it. Layout (little-endian)::
+
+    magic (8 bytes) | meta length (u32) | meta JSON | padding to 8 bytes | data
+
+``meta`` records the byte range of each section in ``data`` and, for every
+indexed field, the ``[value, offset, count]`` of its posting list:
+
+    id_offsets    u64[n + 1]  offsets of each question ID in ``ids``
+    ids           UTF-8 question IDs, concatenated
+    id_order      u32[n]      positions sorted by question ID (for lookups)
+    postings      u32[...]    positions per indexed field value
+    body_offsets  u64[n + 1]  offsets of each question in ``bodies``
+    bodies        compact JSON of each question, concatenated
+
+Only the small meta block is decoded at startup; questions are decoded on
+access and pages are shared between workers through the OS page cache.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+
+from atomic_file import atomic_write
+from question_index import EMPTY, INDEXED_FIELDS, QuestionIndex, indexed_value
+
+MAGIC = b"CPAQB\x00\x01\x00"
+HEADER = struct.Struct("<8sI")
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def write_compiled_bank(questions, path):
+    ids = [q.get("id", "") for q in questions]
+    encoded_ids = [qid.encode("utf-8") for qid in ids]
+    bodies = [
+        json.dumps(q, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for q in questions
+    ]
+
+    def offsets(chunks):
+        out = array("Q", [0])
+        for chunk in chunks:
+            out.append(out[-1] + len(chunk))
+        return out
+
+    postings = array("I")
+    posting_meta = {}
+    for field in INDEXED_FIELDS:
+        buckets = {}
+        for position, q in enumerate(questions):
+            buckets.setdefault(indexed_value(q, field), []).append(position)
+        posting_meta[field] = []
+        for value, positions in buckets.items():
+            posting_meta[field].append([value, len(postings), len(positions)])
+            postings.extend(positions)
+
+    sections = [
+        ("id_offsets", _little_endian(offsets(encoded_ids))),
+        ("ids", b"".join(encoded_ids)),
+        ("id_order", _little_endian(array("I", sorted(range(len(ids)), key=ids.__getitem__)))),
+        ("postings", _little_endian(postings)),
+        ("body_offsets", _little_endian(offsets(bodies))),
+        ("bodies", b"".join(bodies)),
+    ]
+    section_meta = {}
+    cursor = 0
+    for name, blob in sections:
+        section_meta[name] = [cursor, len(blob)]
+        cursor = _align(cursor + len(blob))
+
+    meta = json.dumps(
+        {
+            "total_questions": len(questions),
+            "sections": section_meta,
+            "postings": posting_meta,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    header = HEADER.pack(MAGIC, len(meta)) + meta
+    header += b"\0" * (_align(len(header)) - len(header))
+
+    with atomic_write(path) as f:
+        f.write(header)
+        for _name, blob in sections:
+            f.write(blob)
+            f.write(b"\0" * (_align(len(blob)) - len(blob)))
+
+
+class CompiledQuestionBank(Sequence):
+    """Read-only sequence of questions backed by a memory-mapped file."""
+
+    def __init__(self, path, decoded_cache_size=4096):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, meta_len = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled question bank")
+        meta = json.loads(bytes(buf[HEADER.size : HEADER.size + meta_len]))
+        data = buf[_align(HEADER.size + meta_len) :]
+
+        def section(name, fmt=None):
+            start, length = meta["sections"][name]
+            view = data[start : start + length]
+            if fmt is None:
+                return view
+            if sys.byteorder == "big":
+                arr = array(fmt, bytes(view))
+                arr.byteswap()
+                return arr
+            return view.cast(fmt)
+
+        self.total_questions = meta["total_questions"]
+        self._id_offsets = section("id_offsets", "Q")
+        self._ids = section("ids")
+        self._id_order = section("id_order", "I")
+        self._postings = section("postings", "I")
+        self._body_offsets = section("body_offsets", "Q")
+        self._bodies = section("bodies")
+        self._posting_ranges = {
+            field: {value: (offset, count) for value, offset, count in entries}
+            for field, entries in meta["postings"].items()
+        }
+        self._decode = lru_cache(maxsize=decoded_cache_size)(self._decode_question)
+
+    def __len__(self):
+        return self.total_questions
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[p] for p in range(*position.indices(len(self)))]
+        if position < 0:
+            position += self.total_questions
+        if not 0 <= position < self.total_questions:
+            raise IndexError("question position out of range")
+        return self._decode(position)
+
+    def _decode_question(self, position):
+        start = self._body_offsets[position]
+        end = self._body_offsets[position + 1]
+        return json.loads(bytes(self._bodies[start:end]))
+
+    def question_bytes(self, position):
+        """The stored compact JSON of a question, without decoding it."""
+        start = self._body_offsets[position]
+        end = self._body_offsets[position + 1]
+        return bytes(self._bodies[start:end])
+
+    def question_id(self, position):
+        start = self._id_offsets[position]
+        end = self._id_offsets[position + 1]
+        return bytes(self._ids[start:end]).decode("utf-8")
+
+    def position_of(self, question_id):
+        if not isinstance(question_id, str):
+            # Stored IDs are strings; anything else would break the search.
+            return None
+        lo, hi = 0, self.total_questions
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.question_id(self._id_order[mid]) < question_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.total_questions:
+            position = self._id_order[lo]
+            if self.question_id(position) == question_id:
+                return position
+        return None
+
+    def has_posting(self, field, value):
+        return value in self._posting_ranges[field]
+
+    def positions(self, field, value):
+        offset, count = self._posting_ranges[field].get(value, (0, 0))
+        return self._postings[offset : offset + count]
+
+
+class CompiledQuestionIndex(QuestionIndex):
+    """QuestionIndex over a CompiledQuestionBank.
+
+    Posting sets are materialized from the file the first time a value is
+    queried, so opening the bank does no per-question work.
+    """
+
+    def __init__(self, bank):
+        self.questions = bank
+        self._posting_sets = {}
+
+    def posting(self, field, value):
+        key = (field, value)
+        positions = self._posting_sets.get(key)
+        if positions is None:
+            if not self.questions.has_posting(field, value):
+                # Only cache real values; query strings are unbounded.
+                return EMPTY
+            positions = frozenset(self.questions.positions(field, value))
+            self._posting_sets[key] = positions
+        return positions
+
+    def position_of(self, question_id):
+        return self.questions.position_of(question_id)
+
+    def question_id(self, position):
+        return self.questions.question_id(position)
+
+    def question_json(self, position):
+        return self.questions.question_bytes(position)
+
+
+def load_question_bank(data_dir, fmt="auto"):
+    """Return ``(questions_data, index)`` for the bank under data_dir.
+
+    ``fmt`` is "json", "compiled", or "auto" to use question_bank.bin when it
+    is at least as new as question_bank.json.
+    """
+    json_path = os.path.join(data_dir, "question_bank.json")
+    bin_path = os.path.join(data_dir, "question_bank.bin")
+    if fmt == "auto":
+        use_compiled = os.path.exists(bin_path) and (
+            not os.path.exists(json_path)
+            or os.path.getmtime(bin_path) >= os.path.getmtime(json_path)
+        )
+    else:
+        use_compiled = fmt == "compiled"
+
+    if use_compiled:
+        bank = CompiledQuestionBank(bin_path)
+        return (
+            {"total_questions": len(bank), "questions": bank},
+            CompiledQuestionIndex(bank),
+        )
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        questions_data = json.load(f)
+    return questions_data, QuestionIndex(questions_data.get("questions", []))
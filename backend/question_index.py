@@ -0,0 +1,149 @@
+import hashlib
+import heapq
+import json
+import random
+from array import array
+
+INDEXED_FIELDS = ("lesson", "chapter_id", "type", "difficulty")
+MASK64 = (1 << 64) - 1
+
+
+def question_lesson_key(question_id):
+    """Lesson key a question belongs to, e.g. "ex_3_2_5" -> "3_2".
+
+    Matches the keys clients use for ``progress.lessons``.
+    """
+    return question_id.replace("ex_", "").rsplit("_", 1)[0]
+
+
+def indexed_value(question, field):
+    if field == "lesson":
+        return question_lesson_key(question.get("id", ""))
+    return question.get(field)
+
+
+def question_hash(question_id):
+    digest = hashlib.blake2b(question_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _mix64(x):
+    """splitmix64 finalizer: a bijection on 64-bit ints that scatters bits."""
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+EMPTY = frozenset()
+
+
+class QuestionIndex:
+    """Positional indexes over the question bank.
+
+    Every indexed field maps a value to the set of positions in ``questions``
+    holding it, so filters become set intersections instead of list scans.
+    """
+
+    _id_hashes = None
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.by_id = {}
+        self.postings = {field: {} for field in INDEXED_FIELDS}
+        for position, q in enumerate(questions):
+            self.by_id[q.get("id", "")] = position
+            for field in INDEXED_FIELDS:
+                bucket = self.postings[field].setdefault(indexed_value(q, field), set())
+                bucket.add(position)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def posting(self, field, value):
+        return self.postings[field].get(value, EMPTY)
+
+    def position_of(self, question_id):
+        return self.by_id.get(question_id)
+
+    def question_id(self, position):
+        return self.questions[position].get("id", "")
+
+    def question_json(self, position):
+        """Compact JSON of one question as UTF-8 bytes."""
+        return json.dumps(
+            self.questions[position], ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    def id_hashes(self):
+        """64-bit hash of every question ID by position, built on first use."""
+        if self._id_hashes is None:
+            self._id_hashes = array(
+                "Q", (question_hash(self.question_id(p)) for p in range(len(self)))
+            )
+        return self._id_hashes
+
+    def select(
+        self,
+        lessons=None,
+        question_ids=None,
+        chapter_id=None,
+        type=None,
+        difficulty=None,
+    ):
+        """Positions matching every given filter.
+
+        ``lessons`` and ``question_ids`` are collections (an empty one matches
+        nothing); the scalar filters are skipped when falsy, as in the original
+        list-comprehension chain. Returns None when nothing was filtered,
+        meaning "every question".
+        """
+        candidates = []
+        if lessons is not None:
+            matched = set()
+            for lesson in lessons:
+                matched |= self.posting("lesson", lesson)
+            candidates.append(matched)
+        if question_ids is not None:
+            positions = (self.position_of(qid) for qid in question_ids)
+            candidates.append({p for p in positions if p is not None})
+        if chapter_id:
+            candidates.append(self.posting("chapter_id", chapter_id))
+        if type:
+            candidates.append(self.posting("type", type))
+        if difficulty:
+            candidates.append(self.posting("difficulty", difficulty))
+
+        if not candidates:
+            return None
+        candidates.sort(key=len)
+        return set(candidates[0]).intersection(*candidates[1:])
+
+    def sample(self, positions, k):
+        """Up to k random questions from ``positions`` (None = all)."""
+        if positions is None:
+            population = range(len(self.questions))
+        else:
+            population = list(positions)
+        picked = random.sample(population, min(k, len(population)))
+        return [self.questions[p] for p in picked]
+
+    def page(self, positions, seed, after=None, limit=20):
+        """One page of ``positions`` (None = all) in a shuffled order fixed by
+        ``seed``.
+
+        The order depends only on the seed and the question IDs, so it stays
+        the same across requests, workers and bank reloads. ``after`` is the
+        key returned for the previous page. Returns ``(questions, key)``,
+        where key is None on the last page.
+        """
+        hashes = self.id_hashes()
+        seed &= MASK64
+        if positions is None:
+            positions = range(len(hashes))
+        keyed = ((_mix64(hashes[p] ^ seed), p) for p in positions)
+        if after is not None:
+            keyed = (item for item in keyed if item[0] > after)
+        # Only the next limit + 1 keys are kept, not a sorted copy of all.
+        picked = heapq.nsmallest(limit + 1, keyed)
+        key = picked[limit - 1][0] if len(picked) > limit else None
+        return [self.questions[p] for _, p in picked[:limit]], key
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Answer counters per question, aggregated across all users.
+
+The API records every answer in a QuestionStatsAggregator; the pending
+counts are periodically added to the totals kept by the progress store, so
+several workers can feed the same totals. Totals can also be recomputed in
+bulk from existing progress with::
+
+    python backend/question_stats.py rebuild [--jobs N]
+
+Run the rebuild while the API is stopped: answers flushed during the scan
+would otherwise be overwritten.
+"""
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from compact_state import expand_question_states, load_question_ordinals
+from progress_store import JsonFileStore, create_progress_store, read_user_document
+
+GROUP_FIELDS = {
+    "chapter": "chapter_id",
+    "type": "type",
+    "difficulty": "difficulty",
+}
+
+
+class QuestionStatsAggregator:
+    """Pending ``question_id -> [attempts, correct]`` since the last flush."""
+
+    def __init__(self):
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def record(self, question_id, is_correct):
+        counts = self.pending.get(question_id)
+        if counts is None:
+            counts = self.pending[question_id] = [0, 0]
+        counts[0] += 1
+        if is_correct:
+            counts[1] += 1
+
+    def take(self):
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def restore(self, pending):
+        """Put back counts whose flush failed."""
+        for question_id, (attempts, correct) in pending.items():
+            counts = self.pending.setdefault(question_id, [0, 0])
+            counts[0] += attempts
+            counts[1] += correct
+
+
+def _row(key, attempts, correct):
+    return {
+        "key": key,
+        "attempts": attempts,
+        "correct": correct,
+        "accuracy": round(correct / attempts, 4) if attempts else None,
+    }
+
+
+def summarize_question_stats(
+    totals, question_for, group_by="question", min_attempts=1
+):
+    """Accuracy rows for ``totals`` grouped by question, chapter, type or
+    difficulty, least accurate first.
+
+    ``question_for(question_id)`` returns the bank entry or None; questions no
+    longer in the bank are skipped. Question rows carry ``vs_difficulty``,
+    their accuracy minus the mean for questions of the same difficulty, to
+    spot badly calibrated ones.
+    """
+    min_attempts = max(1, min_attempts)
+    groups = {}
+    questions = []
+    by_difficulty = {}
+    for question_id, (attempts, correct) in totals.items():
+        question = question_for(question_id)
+        if question is None:
+            continue
+        if group_by == "question":
+            questions.append((question_id, question, attempts, correct))
+            level = by_difficulty.setdefault(question.get("difficulty"), [0, 0])
+        else:
+            key = question.get(GROUP_FIELDS[group_by])
+            level = groups.setdefault(key, [0, 0])
+        level[0] += attempts
+        level[1] += correct
+
+    if group_by != "question":
+        rows = [
+            _row(key, attempts, correct)
+            for key, (attempts, correct) in groups.items()
+            if attempts >= min_attempts
+        ]
+    else:
+        rows = []
+        for question_id, question, attempts, correct in questions:
+            if attempts < min_attempts:
+                continue
+            row = _row(question_id, attempts, correct)
+            level_attempts, level_correct = by_difficulty[question.get("difficulty")]
+            row.update(
+                {
+                    "chapter_id": question.get("chapter_id"),
+                    "type": question.get("type"),
+                    "difficulty": question.get("difficulty"),
+                    "vs_difficulty": round(
+                        row["accuracy"] - level_correct / level_attempts, 4
+                    ),
+                }
+            )
+            rows.append(row)
+    rows.sort(key=lambda row: (row["accuracy"], -row["attempts"]))
+    return rows
+
+
+_worker_ordinals = None
+
+
+def _init_worker(data_dir):
+    global _worker_ordinals
+    _worker_ordinals = load_question_ordinals(data_dir)
+
+
+def _add_document(totals, data):
+    states = expand_question_states(
+        data.get("progress", {}).get("question_states", {}), _worker_ordinals
+    )
+    for question_id, state in states.items():
+        correct = state.get("correct", 0)
+        counts = totals.setdefault(question_id, [0, 0])
+        counts[0] += correct + state.get("wrong", 0)
+        counts[1] += correct
+
+
+def _count_files(paths):
+    totals = {}
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                _add_document(totals, read_user_document(f))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return totals
+
+
+def count_json_progress(user_dir, data_dir, jobs=1, chunk_size=500):
+    """Sum correct/wrong per question over every user file, in parallel,
+    plus the archived users."""
+    paths = [
+        entry.path
+        for entry in os.scandir(user_dir)
+        if entry.name.endswith(".json") and entry.is_file()
+    ]
+    chunks = [paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    if jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(data_dir,)
+        ) as pool:
+            results = list(pool.map(_count_files, chunks))
+    else:
+        _init_worker(data_dir)
+        results = [_count_files(chunk) for chunk in chunks]
+
+    totals = {}
+    for partial in results:
+        for question_id, (attempts, correct) in partial.items():
+            counts = totals.setdefault(question_id, [0, 0])
+            counts[0] += attempts
+            counts[1] += correct
+
+    # Archives are read here, sequentially; they hold the least active users.
+    _init_worker(data_dir)
+    live = {os.path.basename(path)[: -len(".json")] for path in paths}
+    users = len(paths)
+    for user_id, body in JsonFileStore(user_dir).archive.iter_documents():
+        if user_id in live:
+            continue
+        try:
+            _add_document(totals, read_user_document(io.BytesIO(body)))
+        except Exception as e:
+            print(f"Skipping archived {user_id}: {e}")
+            continue
+        users += 1
+    return totals, users
+
+
+def main():
+    data_dir = os.path.join(
+        os.path.dirname(__file__), os.environ.get("DATA_DIR", "../data")
+    )
+    parser = argparse.ArgumentParser(description="CPA_PATH question statistics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser(
+        "rebuild", help="Recompute per-question totals from stored progress"
+    )
+    rebuild.add_argument(
+        "--store",
+        choices=("json", "sqlite"),
+        default=os.environ.get("PROGRESS_STORE", "json"),
+    )
+    rebuild.add_argument("--source", default=os.path.join(data_dir, "user_progress"))
+    rebuild.add_argument(
+        "--db",
+        default=os.environ.get(
+            "PROGRESS_DB_PATH", os.path.join(data_dir, "user_progress.db")
+        ),
+    )
+    rebuild.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        store = create_progress_store(args.store, args.source, args.db)
+        try:
+            if args.store == "sqlite":
+                totals = store.question_state_totals()
+                users = "all"
+            else:
+                totals, users = count_json_progress(args.source, data_dir, args.jobs)
+            store.replace_question_stats(totals)
+        finally:
+            store.close()
+        print(f"Rebuilt stats for {len(totals)} questions from {users} users")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""SM-2 style scheduling for practice questions.
+
+Each ``question_states`` entry gains ``ef`` (easiness factor), ``reps``
+(consecutive correct answers), ``interval`` (days) and ``due`` (ISO
+timestamp of the next review). A wrong answer resets the repetition count
+and brings the question back after RELEARN_MINUTES.
+"""
+import heapq
+from collections import OrderedDict
+from datetime import timedelta
+
+DEFAULT_EF = 2.5
+MIN_EF = 1.3
+RELEARN_MINUTES = 10
+# Keeps long streaks of correct answers from overflowing datetime.
+MAX_INTERVAL_DAYS = 36500
+# Answers are right/wrong only, so map them onto SM-2's 0-5 quality scale.
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 1
+
+
+def schedule(state, is_correct, now):
+    quality = CORRECT_QUALITY if is_correct else WRONG_QUALITY
+    ef = state.get("ef", DEFAULT_EF)
+    ef = max(MIN_EF, ef + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    if is_correct:
+        reps = state.get("reps", 0) + 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = max(1, round(state.get("interval", 1) * ef))
+            interval = min(interval, MAX_INTERVAL_DAYS)
+        due = now + timedelta(days=interval)
+    else:
+        reps = 0
+        interval = 0
+        due = now + timedelta(minutes=RELEARN_MINUTES)
+
+    state["ef"] = round(ef, 3)
+    state["reps"] = reps
+    state["interval"] = interval
+    state["due"] = due.isoformat(timespec="seconds")
+
+
+def review_due_key(state):
+    """Heap key for a state, or None if it should never be reviewed.
+
+    Questions answered before scheduling existed have no ``due``; the ones
+    the user got wrong are treated as overdue.
+    """
+    due = state.get("due")
+    if due is not None:
+        return due
+    if state.get("wrong", 0) > 0:
+        return ""
+    return None
+
+
+class ReviewIndex:
+    """Per-user min-heaps of ``(due, question_id)`` with lazy deletion.
+
+    Heaps are built on demand from ``question_states`` and kept for the most
+    recently used ``max_users``. A heap is tied to the states dict it was
+    built from, so reloading or resetting a user rebuilds it.
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self._heaps = OrderedDict()
+
+    def _heap(self, user_id, states):
+        entry = self._heaps.get(user_id)
+        if entry is not None and entry[0] is states:
+            self._heaps.move_to_end(user_id)
+            return entry[1]
+        heap = []
+        for question_id, state in states.items():
+            if not isinstance(question_id, str):
+                continue  # Not a bank question; would not sort with the rest.
+            key = review_due_key(state)
+            if key is not None:
+                heap.append((key, question_id))
+        heapq.heapify(heap)
+        self._heaps[user_id] = (states, heap)
+        self._heaps.move_to_end(user_id)
+        while len(self._heaps) > self.max_users:
+            self._heaps.popitem(last=False)
+        return heap
+
+    def update(self, user_id, states, question_ids):
+        entry = self._heaps.get(user_id)
+        if entry is None or entry[0] is not states:
+            # Built lazily with the new due times on the next due() call.
+            return
+        heap = entry[1]
+        for question_id in question_ids:
+            if not isinstance(question_id, str):
+                continue
+            key = review_due_key(states.get(question_id, {}))
+            if key is not None:
+                heapq.heappush(heap, (key, question_id))
+        if len(heap) > 2 * len(states) + 64:
+            # Too many superseded entries; start over.
+            del self._heaps[user_id]
+
+    def due(self, user_id, states, now, limit):
+        """Up to ``limit`` question IDs due at ``now``, most overdue first."""
+        heap = self._heap(user_id, states)
+        cutoff = now.isoformat(timespec="seconds")
+        picked = []
+        seen = set()
+        while heap and len(picked) < limit and heap[0][0] <= cutoff:
+            key, question_id = heapq.heappop(heap)
+            if question_id in seen or review_due_key(states.get(question_id, {})) != key:
+                continue  # superseded by a later answer
+            seen.add(question_id)
+            picked.append((key, question_id))
+        for item in picked:
+            heapq.heappush(heap, item)
+        return [question_id for _key, question_id in picked]
+
+    def forget(self, user_id):
+        self._heaps.pop(user_id, None)
@@ -0,0 +1,73 @@
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+QUESTION_IDS = ["ex_1_1_1", "ex_1_1_2", "ex_1_1_3"]
+
+
+def question(question_id):
+    return {
+        "id": question_id,
+        "type": "single_choice",
+        "difficulty": 1,
+        "chapter_id": "1",
+        "lesson_id": "1_1",
+        "question": f"{question_id}?",
+        "options": ["A", "B"],
+        "correct_answer": "A",
+        "explanation": "",
+    }
+
+
+def write_content(data_dir):
+    chapter_dir = os.path.join(data_dir, "chapter_1")
+    os.makedirs(chapter_dir)
+    with open(os.path.join(chapter_dir, "index.json"), "w") as f:
+        json.dump({"chapter": {"chapter_id": "1", "title": "Ch1", "total_xp": 20}}, f)
+    with open(os.path.join(chapter_dir, "lesson_1_1.json"), "w") as f:
+        # Large enough to be served pre-compressed.
+        exercises = [
+            dict(question(qid), explanation="Explanation. " * 40)
+            for qid in QUESTION_IDS
+        ]
+        json.dump({"chapter_id": "1", "lesson_id": "1_1", "exercises": exercises}, f)
+    questions = [question(qid) for qid in QUESTION_IDS]
+    with open(os.path.join(data_dir, "question_bank.json"), "w") as f:
+        json.dump({"total_questions": len(questions), "questions": questions}, f)
+    with open(os.path.join(data_dir, "question_ordinals.json"), "w") as f:
+        json.dump({"ids": QUESTION_IDS}, f)
+    os.makedirs(os.path.join(data_dir, "user_progress"))
+
+
+# main reads its configuration on import, so point it at test data first.
+DATA_DIR = tempfile.mkdtemp(prefix="cpa_test_data_")
+atexit.register(shutil.rmtree, DATA_DIR, True)
+write_content(DATA_DIR)
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["PROGRESS_STORE"] = "json"
+os.environ["QUESTION_BANK_FORMAT"] = "json"
+# Tests run flushes themselves.
+os.environ["USER_FLUSH_INTERVAL"] = "3600"
+
+
+def visitor():
+    return {"X-CPA-Visitor": f"test-{uuid.uuid4()}"}
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import main
+from conftest import QUESTION_IDS, visitor
+
+
+def test_lesson_xp_is_validated_and_clamped(client):
+    headers = visitor()
+    response = client.post(
+        "/api/user/lesson/complete",
+        json={"lesson_id": "1_1", "xp_earned": 50_000_000},
+        headers=headers,
+    )
+    assert response.json()["xp_earned"] == main.MAX_LESSON_XP
+
+    response = client.post(
+        "/api/user/lesson/complete",
+        json={"lesson_id": "1_1", "xp_earned": "9"},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_invalid_ids_are_rejected(client):
+    headers = visitor()
+    for data in ({"question_id": 123, "is_correct": False}, {"is_correct": True}):
+        response = client.post("/api/user/answer", json=data, headers=headers)
+        assert response.status_code == 400
+
+    response = client.post(
+        "/api/user/lesson/complete", json={"xp_earned": 5}, headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_lesson_score_is_validated(client):
+    headers = visitor()
+    for score in (10**30, -1, 101, "90", 9.5, True):
+        response = client.post(
+            "/api/user/lesson/complete",
+            json={"lesson_id": "1_1", "score": score},
+            headers=headers,
+        )
+        assert response.status_code == 400, score
+    assert headers["X-CPA-Visitor"] not in main.dirty_users
+
+
+def test_store_error_is_503_not_a_reset(client, monkeypatch):
+    headers = visitor()
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main.progress_store, "load", locked)
+    response = client.get("/api/user/profile", headers=headers)
+
+    assert response.status_code == 503
+    assert headers["X-CPA-Visitor"] not in main.dirty_users
+    assert headers["X-CPA-Visitor"] not in main.user_progress_cache
+
+
+def test_corrupt_document_is_reset(client):
+    headers = visitor()
+    path = main.progress_store.path_for(headers["X-CPA-Visitor"])
+    with open(path, "w") as f:
+        f.write("{not json")
+
+    response = client.get("/api/user/profile", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["xp"] == 0
+    os.remove(path)
+
+
+def test_new_visitor_gets_id_on_every_user_route(client):
+    for path in (
+        "/api/questions",
+        "/api/user/progress",
+        "/api/user/summary",
+        "/api/review",
+        "/api/leaderboard",
+        "/api/user/profile",
+    ):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert len(response.headers.get_list("x-cpa-visitor")) == 1, path
+    known = client.get("/api/user/profile", headers=visitor())
+    assert "x-cpa-visitor" not in known.headers
+
+
+def test_bad_batch_applies_nothing(client):
+    headers = visitor()
+    before = client.get("/api/user/progress", headers=headers).json()
+    ok = {"question_id": "ex_1_1_1", "is_correct": True}
+
+    bad_answers = (
+        "x",
+        {"is_correct": True},
+        {"question_id": "ex_1_1_2", "is_correct": 1},
+    )
+    for bad in bad_answers:
+        response = client.post(
+            "/api/user/answers", json={"answers": [ok, bad]}, headers=headers
+        )
+        assert response.status_code == 400
+        assert response.json()["error"].startswith("answers[1]:")
+
+    assert client.get("/api/user/progress", headers=headers).json() == before
+
+
+def test_backdated_answers_do_not_restore_a_streak():
+    now = datetime(2026, 3, 10, 12)
+    assert main.parse_client_time((now - timedelta(days=3)).isoformat(), now) == now
+    recent = now - timedelta(hours=5)
+    assert main.parse_client_time(recent.isoformat(), now) == recent
+    assert main.parse_client_time((now + timedelta(days=1)).isoformat(), now) == now
+
+
+def test_unsafe_visitor_ids_are_rejected(client):
+    for visitor_id in ("evil/x", "../x", "a b", "x" * 129):
+        response = client.get(
+            "/api/user/profile", headers={"X-CPA-Visitor": visitor_id}
+        )
+        assert response.status_code == 400
+        assert visitor_id not in main.user_progress_cache
+
+
+def test_pages_cover_questions_outside_completed_lessons(client):
+    headers = visitor()
+    client.post(
+        "/api/user/lesson/complete", json={"lesson_id": "1_2"}, headers=headers
+    )
+    sample = client.get("/api/questions", headers=headers).json()
+    assert sample["total"] == 0
+
+    seen = []
+    params = {"limit": 2, "seed": 7}
+    while True:
+        page = client.get("/api/questions", params=params, headers=headers).json()
+        assert page["total"] == len(QUESTION_IDS)
+        seen.extend(question["id"] for question in page["questions"])
+        if page["next_cursor"] is None:
+            break
+        params = {"cursor": page["next_cursor"], "limit": 2}
+    assert sorted(seen) == QUESTION_IDS
+
+
+def test_progress_delta_after_answers(client):
+    headers = visitor()
+    client.post(
+        "/api/user/answer",
+        json={"question_id": "ex_1_1_1", "is_correct": True},
+        headers=headers,
+    )
+    revision = client.get("/api/user/progress", headers=headers).json()["revision"]
+
+    client.post(
+        "/api/user/answer",
+        json={"question_id": "ex_1_1_2", "is_correct": False},
+        headers=headers,
+    )
+    delta = client.get(
+        "/api/user/progress", params={"since": revision}, headers=headers
+    ).json()
+
+    assert delta["full"] is False
+    assert delta["revision"] == revision + 1
+    assert list(delta["changes"]["question_states"]) == ["ex_1_1_2"]
+    assert delta["changes"]["question_states"]["ex_1_1_2"]["wrong"] == 1
+    assert "change_log" not in delta
+
+    current = client.get(
+        "/api/user/progress", params={"since": revision + 1}, headers=headers
+    ).json()
+    assert current["changes"] == {}
+    full = client.get(
+        "/api/user/progress", params={"since": revision + 5}, headers=headers
+    ).json()
+    assert full["full"] is True
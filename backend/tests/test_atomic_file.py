@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from atomic_file import atomic_write
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / "data.json")
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write("old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, "w", encoding="utf-8") as f:
+            f.write("partial")
+            raise RuntimeError("disk full")
+
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "old"
+    assert os.listdir(tmp_path) == ["data.json"]
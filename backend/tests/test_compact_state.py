@@ -0,0 +1,56 @@
+from compact_state import CompactQuestionStates, QuestionOrdinals
+
+
+def test_pack_unpack_round_trip():
+    ordinals = QuestionOrdinals(["a", "b"])
+    states = CompactQuestionStates(ordinals)
+    states["b"] = {"correct": 2, "wrong": 1, "ef": 2.36, "due": "2026-01-02T03:04:05"}
+    states["a"] = {"correct": 0, "wrong": 3, "note": "extra"}
+    states["unknown"] = {"correct": 1, "wrong": 0}
+
+    unpacked = CompactQuestionStates.unpack(states.pack(), ordinals)
+
+    assert {qid: dict(state) for qid, state in unpacked.items()} == {
+        "a": {"correct": 0, "wrong": 3, "note": "extra"},
+        "b": {"correct": 2, "wrong": 1, "ef": 2.36, "due": "2026-01-02T03:04:05"},
+        "unknown": {"correct": 1, "wrong": 0},
+    }
+
+
+def test_unmapped_state_moves_to_slot_once_id_has_ordinal():
+    states = CompactQuestionStates(QuestionOrdinals(["a"]))
+    states["b"] = {"correct": 2, "wrong": 3}
+
+    unpacked = CompactQuestionStates.unpack(
+        states.pack(), QuestionOrdinals(["a", "b"])
+    )
+
+    assert "b" in unpacked
+    assert list(unpacked) == ["b"]
+    assert unpacked._unmapped == {}
+    unpacked["b"]["wrong"] += 1
+    assert dict(unpacked["b"]) == {"correct": 2, "wrong": 4}
+
+
+def test_unmapped_and_slot_copies_are_merged():
+    ordinals = QuestionOrdinals(["a", "b"])
+    # Saved by a version that opened a slot next to the stale unmapped copy.
+    states = CompactQuestionStates(ordinals)
+    states["b"] = {"correct": 1, "wrong": 0, "reps": 1}
+    packed = states.pack()
+    packed["unmapped"] = {"b": {"correct": 2, "wrong": 3}}
+
+    unpacked = CompactQuestionStates.unpack(packed, ordinals)
+
+    assert list(unpacked) == ["b"]
+    assert dict(unpacked["b"]) == {"correct": 3, "wrong": 3, "reps": 1}
+
+
+def test_from_dict_maps_known_ids():
+    ordinals = QuestionOrdinals(["a"])
+    states = CompactQuestionStates.from_dict(
+        {"a": {"correct": 1, "wrong": 0}, "z": {"correct": 0, "wrong": 1}}, ordinals
+    )
+
+    assert list(states) == ["a", "z"]
+    assert states._unmapped == {"z": {"correct": 0, "wrong": 1}}
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import http_encoding
+from conftest import visitor, write_content
+from content_snapshot import build_content_snapshot
+
+CONTENT_PATHS = ("/api/chapters", "/api/chapters/1", "/api/chapters/1/lessons/1_1")
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+@pytest.mark.parametrize("path", CONTENT_PATHS)
+def test_content_revalidates_with_its_etag(client, path):
+    response = client.get(path, headers=IDENTITY)
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+    assert "max-age" in response.headers["cache-control"]
+
+    for if_none_match in (etag, f'"other", W/{etag}', "*"):
+        again = client.get(path, headers={**IDENTITY, "If-None-Match": if_none_match})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+    stale = client.get(path, headers={**IDENTITY, "If-None-Match": '"other"'})
+    assert stale.status_code == 200
+    assert stale.content == response.content
+
+
+def test_missing_content_has_no_etag(client):
+    response = client.get("/api/chapters/9/lessons/9_1", headers=IDENTITY)
+    assert "etag" not in response.headers
+
+
+def test_content_is_served_precompressed(client):
+    path = "/api/chapters/1/lessons/1_1"
+    plain = client.get(path, headers=IDENTITY)
+    gzipped = client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in plain.headers
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in gzipped.headers["vary"]
+    assert int(gzipped.headers["content-length"]) < len(plain.content)
+    assert gzipped.content == plain.content
+    # Each encoding has its own ETag, and either one revalidates.
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+    for etag in (plain.headers["etag"], gzipped.headers["etag"]):
+        again = client.get(
+            path, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        assert again.status_code == 304
+        assert "content-encoding" not in again.headers
+
+
+def test_large_json_responses_are_compressed(client, monkeypatch):
+    monkeypatch.setattr(http_encoding, "COMPRESSION_MIN_SIZE", 200)
+    headers = {**visitor(), "Accept-Encoding": "gzip"}
+
+    response = client.get("/api/questions", params={"limit": 3}, headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["questions"]) == 3
+
+    small = client.get("/", headers=headers)
+    assert "content-encoding" not in small.headers
+    assert small.json()["message"]
+
+    plain = client.get(
+        "/api/questions", params={"limit": 3}, headers={**headers, **IDENTITY}
+    )
+    assert "content-encoding" not in plain.headers
+
+
+def test_malformed_lesson_fails_the_snapshot(tmp_path):
+    data_dir = str(tmp_path)
+    write_content(data_dir)
+    assert build_content_snapshot(data_dir, "json", preload=True)
+    with open(os.path.join(data_dir, "chapter_1", "lesson_1_1.json"), "w") as f:
+        f.write("{broken")
+
+    with pytest.raises(ValueError):
+        build_content_snapshot(data_dir, "json", preload=True)
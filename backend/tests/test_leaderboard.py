@@ -0,0 +1,76 @@
+import random
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from leaderboard import ScoreBoard, SortedEntries, leaderboard_from_rows
+
+
+def test_large_score_ranks_first():
+    board = ScoreBoard()
+    board.set("small", 5)
+    board.set("huge", 10**15)
+    board.set("mid", 7)
+
+    assert board.rank("huge") == 1
+    assert board.rank("mid") == 2
+    assert board.rank("small") == 3
+    assert board.top(1) == [(1, "huge", 10**15)]
+    # Memory follows the number of users, not the score.
+    assert len(board._entries) == 3
+
+
+def test_equal_scores_share_a_rank():
+    board = ScoreBoard({"c": 5, "a": 5, "b": 9, "zero": 0})
+
+    assert len(board) == 3
+    assert board.rank("zero") is None
+    assert board.top(10) == [(1, "b", 9), (2, "a", 5), (2, "c", 5)]
+    assert board.rank("c") == 2
+
+
+def test_updates_move_users():
+    board = ScoreBoard()
+    board.set("a", 10)
+    board.set("b", 20)
+    board.set("a", 30)
+    board.remove("b")
+
+    assert board.top(10) == [(1, "a", 30)]
+    assert board.rank("b") is None
+
+
+def test_leaderboard_from_rows():
+    now = datetime(2026, 3, 4, 12)
+    board = leaderboard_from_rows(
+        [
+            ("a", 100, 10, 3, "2026-03-04"),
+            ("b", 50, 20, 9, "2026-02-01"),
+        ],
+        now,
+    )
+
+    assert board.standings("xp", "b", 10, now)["me"]["rank"] == 2
+    assert board.standings("weekly_xp", "b", 10, now)["me"]["rank"] == 1
+    # b's streak lapsed, so only a is on the streak board.
+    assert board.standings("streak", "a", 10, now)["total_players"] == 1
+
+
+def test_sorted_entries_match_a_sorted_list():
+    rng = random.Random(5)
+    entries = SortedEntries(load=4)
+    expected = []
+    for _ in range(2000):
+        if expected and rng.random() < 0.45:
+            value = expected.pop(rng.randrange(len(expected)))
+            entries.remove(value)
+        else:
+            value = (rng.randrange(-50, 0), f"u{rng.randrange(100)}")
+            if value in expected:
+                continue
+            entries.add(value)
+            insort(expected, value)
+        probe = (rng.randrange(-55, 5),)
+        assert entries.bisect_left(probe) == bisect_left(expected, probe)
+        assert len(entries) == len(expected)
+    assert list(entries) == expected
+    assert entries.head(7) == expected[:7]
@@ -0,0 +1,165 @@
+import io
+import os
+import time
+
+import pytest
+
+from progress_store import UNLOADED, JsonFileStore, SqliteStore, read_user_document
+
+
+def document(xp, lessons=None):
+    return {
+        "profile": {"xp": xp},
+        "progress": {
+            "lessons": lessons or {},
+            "question_states": {"ex_1_1_1": {"correct": 1, "wrong": 0}},
+            "daily_activity": {},
+            "statistics": {},
+        },
+    }
+
+
+def test_sqlite_flush_skips_only_the_bad_user(tmp_path):
+    store = SqliteStore(str(tmp_path / "progress.db"))
+    bad = document(5, lessons={None: {"score": 100}})
+
+    rejected = store.save_many(
+        [
+            ("good1", document(10), None),
+            ("bad", bad, None),
+            ("good2", document(20), None),
+        ]
+    )
+
+    assert rejected == ["bad"]
+    assert store.load("good1")["profile"]["xp"] == 10
+    assert store.load("good2")["profile"]["xp"] == 20
+    assert store.load("bad") is None
+    store.close()
+
+
+def test_sqlite_rejected_user_keeps_stored_rows(tmp_path):
+    store = SqliteStore(str(tmp_path / "progress.db"))
+    store.save("u", document(10, lessons={"1_1": {"score": 90}}))
+
+    bad = document(99, lessons={"1_1": {"score": 90}, None: {"score": 1}})
+    assert store.save_many([("u", bad, None)]) == ["u"]
+
+    stored = store.load("u")
+    assert stored["profile"]["xp"] == 10
+    assert list(stored["progress"]["lessons"]) == ["1_1"]
+    store.close()
+
+
+def test_sqlite_rejects_integers_it_cannot_store(tmp_path):
+    store = SqliteStore(str(tmp_path / "progress.db"))
+    huge = document(10**30)
+
+    rejected = store.save_many([("good", document(1), None), ("huge", huge, None)])
+
+    assert rejected == ["huge"]
+    assert store.load("good")["profile"]["xp"] == 1
+    store.close()
+
+
+def test_non_object_document_is_a_value_error():
+    with pytest.raises(ValueError):
+        read_user_document(io.BytesIO(b"[1, 2]\n"))
+
+
+def test_json_write_skips_only_the_unwritable_user(tmp_path):
+    user_dir = tmp_path / "user_progress"
+    user_dir.mkdir()
+    store = JsonFileStore(str(user_dir))
+    # A directory where the file should go makes the replace fail.
+    os.mkdir(store.path_for("blocked"))
+
+    rejected = store.save_many(
+        [
+            ("good1", document(10), None),
+            ("blocked", document(5), None),
+            ("good2", document(20), None),
+        ]
+    )
+
+    assert rejected == ["blocked"]
+    assert store.load("good1")["profile"]["xp"] == 10
+    assert store.load("good2")["profile"]["xp"] == 20
+
+
+def test_sqlite_change_log_has_its_own_rows(tmp_path):
+    store = SqliteStore(str(tmp_path / "progress.db"))
+    data = document(10)
+    data["revision"] = 3
+    log = {"base": 1, "keys": {"question_states": {"ex_1_1_1": 3}}}
+    data["progress"]["change_log"] = log
+    store.save("u", data)
+
+    extra = store.conn.execute("SELECT progress_extra FROM profile").fetchone()[0]
+    assert "change_log" not in extra
+    assert store.load("u")["progress"]["change_log"] == log
+
+    # An incremental save writes only the log entry that changed.
+    data["revision"] = 4
+    data["progress"]["question_states"]["ex_1_1_2"] = {"correct": 0, "wrong": 1}
+    log["keys"]["question_states"]["ex_1_1_2"] = 4
+    [(_user_id, statements)] = store.prepare(
+        [("u", data, {("question_states", "ex_1_1_2")})]
+    )
+    log_rows = [rows for sql, rows in statements if "INTO change_log" in sql]
+    assert log_rows == [[("u", "question_states", "ex_1_1_2", 4)]]
+    store.write([("u", statements)])
+    assert store.load("u")["progress"]["change_log"] == log
+
+    # Trimmed entries leave the table too.
+    log["base"] = 3
+    del log["keys"]["question_states"]["ex_1_1_1"]
+    data["revision"] = 5
+    log["keys"]["question_states"]["ex_1_1_2"] = 5
+    store.save("u", data, {("question_states", "ex_1_1_2")})
+    assert store.load("u")["progress"]["change_log"] == log
+    store.close()
+
+
+def test_json_lazy_load_leaves_question_states_unloaded(tmp_path):
+    user_dir = tmp_path / "user_progress"
+    user_dir.mkdir()
+    store = JsonFileStore(str(user_dir))
+    store.save("u", document(10))
+
+    lazy = store.load("u", lazy=True)
+    assert lazy["progress"]["question_states"] is UNLOADED
+    assert store.load_section("u", "question_states") == {
+        "ex_1_1_1": {"correct": 1, "wrong": 0}
+    }
+
+    # Saving with the placeholder keeps the stored states.
+    lazy["profile"]["xp"] = 11
+    store.save("u", lazy)
+    stored = store.load("u")
+    assert stored["profile"]["xp"] == 11
+    assert stored["progress"]["question_states"] == {
+        "ex_1_1_1": {"correct": 1, "wrong": 0}
+    }
+
+
+def test_json_idle_users_are_archived_and_still_readable(tmp_path):
+    user_dir = tmp_path / "user_progress"
+    user_dir.mkdir()
+    store = JsonFileStore(str(user_dir), archive_shards=4)
+    for user_id, xp in (("idle", 1), ("skipped", 2), ("active", 3)):
+        store.save(user_id, document(xp))
+    old = time.time() - 10 * 86400
+    for user_id in ("idle", "skipped"):
+        os.utime(store.path_for(user_id), (old, old))
+
+    assert store.archive_idle_users(7, skip={"skipped"}) == 1
+    assert not os.path.exists(store.path_for("idle"))
+    assert os.path.exists(store.path_for("skipped"))
+    assert store.load("idle")["profile"]["xp"] == 1
+    assert store.load_section("idle", "question_states")["ex_1_1_1"]["correct"] == 1
+
+    # The next save brings the user back as a live file that wins.
+    store.save("idle", document(5))
+    assert os.path.exists(store.path_for("idle"))
+    assert store.load("idle")["profile"]["xp"] == 5
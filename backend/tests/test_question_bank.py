@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import main
+from conftest import QUESTION_IDS, question, visitor
+from question_bank import (
+    CompiledQuestionBank,
+    CompiledQuestionIndex,
+    write_compiled_bank,
+)
+from spaced_repetition import ReviewIndex
+
+
+def test_compiled_position_of_ignores_non_string_ids(tmp_path):
+    path = str(tmp_path / "question_bank.bin")
+    write_compiled_bank([question(qid) for qid in QUESTION_IDS], path)
+    bank = CompiledQuestionBank(path)
+
+    assert bank.position_of("ex_1_1_2") == 1
+    assert bank.position_of("missing") is None
+    assert bank.position_of(123) is None
+    assert bank.position_of(None) is None
+
+
+def test_compiled_index_caches_only_known_values(tmp_path):
+    path = str(tmp_path / "question_bank.bin")
+    write_compiled_bank([question(qid) for qid in QUESTION_IDS], path)
+    index = CompiledQuestionIndex(CompiledQuestionBank(path))
+
+    for n in range(100):
+        assert index.posting("chapter_id", f"junk-{n}") == frozenset()
+    assert index.posting("chapter_id", "1") == {0, 1, 2}
+    assert len(index._posting_sets) == 1
+
+
+def test_review_index_skips_non_string_ids():
+    states = {
+        "ex_1_1_1": {"correct": 0, "wrong": 1},
+        123: {"correct": 0, "wrong": 2},
+        None: {"correct": 0, "wrong": 1},
+    }
+
+    due = ReviewIndex().due("u", states, datetime.now(), 10)
+
+    assert due == ["ex_1_1_1"]
+
+
+def test_reset_and_eviction_drop_the_review_heap(client):
+    headers = visitor()
+    user_id = headers["X-CPA-Visitor"]
+    client.post(
+        "/api/user/answer",
+        json={"question_id": "ex_1_1_1", "is_correct": False},
+        headers=headers,
+    )
+    client.get("/api/review", headers=headers)
+    assert user_id in main.review_index._heaps
+
+    client.post("/api/user/reset-progress", headers=headers)
+    assert user_id not in main.review_index._heaps
+
+    client.get("/api/review", headers=headers)
+    assert main.evict_user(user_id, main.user_progress_cache[user_id])
+    main.user_progress_cache.pop(user_id)
+    assert user_id not in main.review_index._heaps
@@ -0,0 +1,38 @@
+from user_cache import LRUUserCache
+
+
+def document():
+    return {"profile": {}, "progress": {}}
+
+
+def test_least_recently_used_entry_is_evicted():
+    evicted = []
+    cache = LRUUserCache(
+        max_entries=2, on_evict=lambda user_id, data: evicted.append(user_id)
+    )
+    cache["a"] = document()
+    cache["b"] = document()
+    cache.get("a")
+    cache["c"] = document()
+
+    assert evicted == ["b"]
+    assert set(cache.keys()) == {"a", "c"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_on_evict_can_keep_an_entry():
+    cache = LRUUserCache(max_entries=1, on_evict=lambda user_id, data: False)
+    cache["busy"] = document()
+    cache["new"] = document()
+
+    assert "busy" in cache
+    assert "new" in cache
+
+
+def test_byte_budget_never_evicts_the_newest_entry():
+    cache = LRUUserCache(max_bytes=1)
+    cache["a"] = document()
+    cache["b"] = document()
+
+    assert list(cache.keys()) == ["b"]
+    assert cache.approx_bytes > 1
@@ -0,0 +1,122 @@
+import threading
+
+import main
+from conftest import visitor
+from progress_store import UNLOADED
+
+
+def evict(user_id):
+    assert main.evict_user(user_id, main.user_progress_cache[user_id])
+    main.user_progress_cache.pop(user_id)
+
+
+def complete_lesson(client, headers, xp):
+    response = client.post(
+        "/api/user/lesson/complete",
+        json={"lesson_id": "1_1", "xp_earned": xp},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+
+def test_request_during_flush_sees_the_evicted_document(client, monkeypatch):
+    headers = visitor()
+    user_id = headers["X-CPA-Visitor"]
+    complete_lesson(client, headers, 50)
+    evict(user_id)
+
+    write = main.progress_store.write
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(payload):
+        started.set()
+        release.wait(5)
+        return write(payload)
+
+    monkeypatch.setattr(main.progress_store, "write", slow_write)
+    flush = client.portal.start_task_soon(main.flush_dirty_users)
+    assert started.wait(5)
+    # The store still holds the old document while the write is running.
+    assert client.get("/api/user/profile", headers=headers).json()["xp"] == 50
+    complete_lesson(client, headers, 2)
+    release.set()
+    flush.result(5)
+    client.portal.call(main.flush_dirty_users)
+
+    assert main.progress_store.load(user_id)["profile"]["xp"] == 52
+    assert not main.flushing_users
+
+
+def test_requests_mark_users_dirty_and_the_flush_writes_them(client):
+    headers = visitor()
+    user_id = headers["X-CPA-Visitor"]
+    complete_lesson(client, headers, 7)
+
+    assert user_id in main.dirty_users
+    assert main.progress_store.load(user_id) is None
+    client.portal.call(main.flush_dirty_users)
+
+    assert user_id not in main.dirty_users
+    assert main.progress_store.load(user_id)["profile"]["xp"] == 7
+
+
+def test_unsaved_users_are_retried_with_a_full_rewrite(client, monkeypatch):
+    headers = visitor()
+    user_id = headers["X-CPA-Visitor"]
+    complete_lesson(client, headers, 7)
+    write = main.progress_store.write
+
+    def reject_all(payload):
+        return [item[0] for item in payload]
+
+    def fail(payload):
+        raise OSError("disk full")
+
+    for broken in (reject_all, fail):
+        monkeypatch.setattr(main.progress_store, "write", broken)
+        client.portal.call(main.flush_dirty_users)
+        assert main.dirty_users[user_id] is None
+        assert main.progress_store.load(user_id) is None
+
+    monkeypatch.setattr(main.progress_store, "write", write)
+    client.portal.call(main.flush_dirty_users)
+    assert main.progress_store.load(user_id)["profile"]["xp"] == 7
+
+
+def test_evicted_dirty_user_is_kept_until_written(client, monkeypatch):
+    monkeypatch.setattr(main.user_progress_cache, "max_entries", 1)
+    first, second = visitor(), visitor()
+    user_id = first["X-CPA-Visitor"]
+    complete_lesson(client, first, 5)
+
+    client.get("/api/user/profile", headers=second)
+    assert user_id not in main.user_progress_cache
+    assert user_id in main.evicted_users
+    # Taken back from evicted_users, not from the store.
+    assert client.get("/api/user/profile", headers=first).json()["xp"] == 5
+    assert user_id in main.dirty_users
+
+    client.get("/api/user/profile", headers=second)
+    client.portal.call(main.flush_dirty_users)
+    assert user_id not in main.evicted_users
+    assert client.get("/api/user/profile", headers=first).json()["xp"] == 5
+
+
+def test_question_states_load_only_when_needed(client):
+    headers = visitor()
+    user_id = headers["X-CPA-Visitor"]
+    client.post(
+        "/api/user/answer",
+        json={"question_id": "ex_1_1_2", "is_correct": False},
+        headers=headers,
+    )
+    client.portal.call(main.flush_dirty_users)
+    evict(user_id)
+
+    client.get("/api/user/profile", headers=headers)
+    progress = main.user_progress_cache[user_id]["progress"]
+    assert progress["question_states"] is UNLOADED
+
+    document = client.get("/api/user/progress", headers=headers).json()
+    assert document["question_states"]["ex_1_1_2"]["wrong"] == 1
+    assert progress["question_states"] is not UNLOADED
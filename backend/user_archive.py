@@ -0,0 +1,96 @@
+"""Packed archives of idle users' progress documents.
+
+Documents are grouped into a fixed number of shards by a hash of the user
+ID, each shard one zip file under ``archive_dir``, so archived users cost
+no inode of their own. A shard is always rewritten whole to a temp file and
+renamed into place, so readers see the old or the new shard, never a torn
+one. The live file under the user directory always wins over an archived
+copy; archived copies of users with a live file are dropped the next time
+their shard is rewritten.
+"""
+import hashlib
+import os
+import threading
+import zipfile
+
+from atomic_file import atomic_write
+
+MEMBER_SUFFIX = ".json"
+
+
+class UserArchive:
+    def __init__(self, archive_dir, shards=64):
+        self.archive_dir = archive_dir
+        self.shards = shards
+        # shard path -> (stat key, member names), so lookups for users that
+        # were never archived do not open the zip.
+        self._names = {}
+        self._rewrite_lock = threading.Lock()
+
+    def shard_of(self, user_id):
+        digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=4).digest()
+        return int.from_bytes(digest, "little") % self.shards
+
+    def shard_path(self, shard):
+        return os.path.join(self.archive_dir, f"shard_{shard:03d}.zip")
+
+    def _member_names(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return frozenset()
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        cached = self._names.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with zipfile.ZipFile(path) as archive:
+            names = frozenset(archive.namelist())
+        self._names[path] = (key, names)
+        return names
+
+    def read(self, user_id):
+        """The archived document bytes, or None."""
+        path = self.shard_path(self.shard_of(user_id))
+        member = user_id + MEMBER_SUFFIX
+        if member not in self._member_names(path):
+            return None
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return archive.read(member)
+        except (FileNotFoundError, KeyError):
+            # The shard was rewritten since the name lookup.
+            return None
+
+    def add(self, shard, documents, is_live):
+        """Rewrite ``shard`` with ``{user_id: bytes}`` added.
+
+        Existing members for which ``is_live(user_id)`` is true are stale
+        (the user came back) and are dropped.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.shard_path(shard)
+        with self._rewrite_lock, atomic_write(path) as f:
+            with zipfile.ZipFile(
+                f, "w", zipfile.ZIP_DEFLATED, compresslevel=9
+            ) as target:
+                if os.path.exists(path):
+                    with zipfile.ZipFile(path) as source:
+                        for info in source.infolist():
+                            user_id = info.filename[: -len(MEMBER_SUFFIX)]
+                            if user_id in documents or is_live(user_id):
+                                continue
+                            target.writestr(info, source.read(info))
+                for user_id, body in documents.items():
+                    target.writestr(user_id + MEMBER_SUFFIX, body)
+
+    def iter_documents(self):
+        """Yield ``(user_id, bytes)`` for every archived document."""
+        if not os.path.isdir(self.archive_dir):
+            return
+        for shard in range(self.shards):
+            path = self.shard_path(shard)
+            if not os.path.exists(path):
+                continue
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    yield info.filename[: -len(MEMBER_SUFFIX)], archive.read(info)
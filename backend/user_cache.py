@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+
+
+def estimate_user_size(data):
+    """Rough resident size of a user document in bytes.
+
+    Counting rows is far cheaper than serializing the document and is close
+    enough for enforcing a memory budget.
+    """
+    progress = data.get("progress", {})
+    states = progress.get("question_states", {})
+    if hasattr(states, "approx_bytes"):
+        states_size = states.approx_bytes()
+    elif hasattr(states, "__len__"):
+        states_size = 200 * len(states)
+    else:
+        states_size = 0  # Not loaded yet.
+    return (
+        1024
+        + 160 * len(progress.get("lessons", {}))
+        + states_size
+        + 240 * len(progress.get("daily_activity", {}))
+    )
+
+
+class LRUUserCache:
+    """Bounded user_id -> document cache with least-recently-used eviction.
+
+    ``max_entries``/``max_bytes`` of 0 disable that limit. ``on_evict`` is
+    called with ``(user_id, data)`` before an entry is dropped so dirty users
+    can be written out first; returning False keeps the entry resident.
+
+    With ``ttl`` (seconds) entries older than that are treated as misses and
+    dropped without ``on_evict``; only use it with a write-through store.
+    """
+
+    def __init__(self, max_entries=0, max_bytes=0, on_evict=None, ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._loaded_at = {}
+        self.approx_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def __getitem__(self, user_id):
+        return self._entries[user_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get(self, user_id):
+        data = self._entries.get(user_id)
+        if data is not None and self.ttl:
+            if time.monotonic() - self._loaded_at[user_id] > self.ttl:
+                self.pop(user_id)
+                data = None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        self._resize(user_id, data)
+        self._evict()
+        return data
+
+    def __setitem__(self, user_id, data):
+        self._entries[user_id] = data
+        self._loaded_at[user_id] = time.monotonic()
+        self._entries.move_to_end(user_id)
+        self._resize(user_id, data)
+        self._evict()
+
+    def pop(self, user_id, default=None):
+        self.approx_bytes -= self._sizes.pop(user_id, 0)
+        self._loaded_at.pop(user_id, None)
+        return self._entries.pop(user_id, default)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self._loaded_at.clear()
+        self.approx_bytes = 0
+
+    def _resize(self, user_id, data):
+        size = estimate_user_size(data)
+        self.approx_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    def _over_limit(self):
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        return bool(self.max_bytes) and self.approx_bytes > self.max_bytes
+
+    def _evict(self):
+        # Never evict the most recently used entry: it is the one the caller
+        # is about to work with.
+        while len(self._entries) > 1 and self._over_limit():
+            user_id, data = next(iter(self._entries.items()))
+            if self.on_evict is not None and self.on_evict(user_id, data) is False:
+                self._entries.move_to_end(user_id)
+                break
+            self.pop(user_id)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "approx_bytes": self.approx_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -122,6 +122,7 @@ export const userApi = {
   getProgress: () => api.get('/user/progress'),
   completeLesson: (data) => api.post('/user/lesson/complete', data),
   submitAnswer: (data) => api.post('/user/answer', data),
+  submitAnswers: (answers) => api.post('/user/answers', { answers }),
   resetProgress: () => api.post('/user/reset-progress'),
 };
 
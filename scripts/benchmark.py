@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""Benchmark the API hot paths against a synthetic data set.
+
+    python scripts/benchmark.py generate --out /tmp/cpa-bench --users 2000
+    python scripts/benchmark.py run --data /tmp/cpa-bench --mode both
+
+``generate`` writes a DATA_DIR with 30 chapters (--lessons per chapter,
+--questions per lesson), the question bank files and --users progress
+documents. ``run`` copies it to a scratch directory, then drives lesson
+fetches, /api/questions, /api/user/answer and /api/user/lesson/complete
+in-process (httpx ASGI transport) and/or through a local uvicorn, and prints
+throughput, p50/p99 latency and RSS growth per scenario. Both steps are
+seeded, so runs on the same data do the same work; use --json to keep
+results for comparing before/after a change. Requires httpx.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from generate_question_bank import process_lesson  # noqa: E402
+from question_bank import write_compiled_bank  # noqa: E402
+
+CHAPTERS = 30
+META_FILE = "benchmark_meta.json"
+SCENARIOS = ("lesson", "questions", "answer", "lesson_complete")
+QUESTION_TYPES = ("single_choice", "multiple_choice", "judgment")
+
+
+def generate(out, lessons, questions, users, seed):
+    rng = random.Random(seed)
+    out = Path(out)
+    if out.exists() and any(out.iterdir()):
+        raise SystemExit(f"{out} is not empty")
+    out.mkdir(parents=True, exist_ok=True)
+
+    lesson_refs = []
+    bank = []
+    for c in range(1, CHAPTERS + 1):
+        chapter_dir = out / f"chapter_{c}"
+        chapter_dir.mkdir()
+        lesson_ids = [f"{c}_{n}" for n in range(1, lessons + 1)]
+        index = {
+            "chapter": {
+                "chapter_id": str(c),
+                "title": f"Chapter {c}",
+                "total_xp": 10 * lessons,
+                "difficulty": rng.randint(1, 3),
+            },
+            "sections": [
+                {
+                    "id": f"{c}_s1",
+                    "title": f"Section {c}.1",
+                    "total_xp": 10 * lessons,
+                    "lessons": [f"lesson_{lesson_id}" for lesson_id in lesson_ids],
+                }
+            ],
+        }
+        with open(chapter_dir / "index.json", "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        for lesson_id in lesson_ids:
+            exercises = [
+                {
+                    "id": f"ex_{lesson_id}_{n}",
+                    "type": rng.choice(QUESTION_TYPES),
+                    "difficulty": rng.randint(1, 3),
+                    "question": f"Question {lesson_id}.{n}: " + "lorem ipsum " * 12,
+                    "options": [f"Option {o} " + "dolor " * 4 for o in "ABCD"],
+                    "correct_answer": "A",
+                    "explanation": "Because " + "sit amet " * 20,
+                }
+                for n in range(1, questions + 1)
+            ]
+            lesson = {
+                "chapter_id": str(c),
+                "lesson_id": lesson_id,
+                "title": f"Lesson {lesson_id}",
+                "content": "consectetur adipiscing " * 200,
+                "exercises": exercises,
+            }
+            lesson_file = chapter_dir / f"lesson_{lesson_id}.json"
+            with open(lesson_file, "w", encoding="utf-8") as f:
+                json.dump(lesson, f, ensure_ascii=False)
+            bank.extend(process_lesson(lesson_file))
+            lesson_refs.append([str(c), lesson_id])
+
+    with open(out / "question_bank.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {"total_questions": len(bank), "questions": bank}, f, ensure_ascii=False
+        )
+    write_compiled_bank(bank, out / "question_bank.bin")
+    question_ids = [q["id"] for q in bank]
+    with open(out / "question_ordinals.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": question_ids}, f)
+
+    user_dir = out / "user_progress"
+    user_dir.mkdir()
+    today = datetime.now()
+    for u in range(users):
+        done = rng.sample(lesson_refs, rng.randint(0, min(40, len(lesson_refs))))
+        answered = rng.sample(question_ids, rng.randint(0, min(300, len(question_ids))))
+        days = [
+            (today - timedelta(days=d)).strftime("%Y-%m-%d")
+            for d in range(rng.randint(0, 60))
+        ]
+        doc = {
+            "profile": {
+                "xp": 20 * len(done) + 2 * len(answered),
+                "level": 1,
+                "streak": min(len(days), rng.randint(0, 30)),
+                "lives": 5,
+                "last_active_date": days[0] if days else None,
+                "last_heart_recovery": None,
+            },
+            "progress": {
+                "lessons": {
+                    lesson_id: {
+                        "completed_at": today.isoformat(),
+                        "score": rng.choice((60, 80, 100)),
+                        "xp_earned": 20,
+                    }
+                    for _c, lesson_id in done
+                },
+                "question_states": {
+                    qid: {"correct": rng.randint(0, 3), "wrong": rng.randint(0, 2)}
+                    for qid in answered
+                },
+                "achievements": [],
+                "statistics": {
+                    "total_questions_answered": len(answered),
+                    "total_correct_answers": len(answered) // 2,
+                    "total_xp_earned": 20 * len(done),
+                    "today_xp": 0,
+                    "lessons_completed": len(done),
+                    "chapters_completed": 0,
+                    "max_streak": 0,
+                    "max_daily_lessons": 0,
+                    "perfect_lessons": 0,
+                },
+                "daily_activity": {
+                    day: {
+                        "xp_earned": rng.randint(0, 80),
+                        "lessons_completed": rng.randint(0, 3),
+                        "questions_answered": rng.randint(0, 40),
+                        "streak_active": True,
+                    }
+                    for day in days
+                },
+            },
+        }
+        with open(user_dir / f"bench_{u}.json", "w", encoding="utf-8") as f:
+            json.dump(doc, f)
+
+    with open(out / META_FILE, "w", encoding="utf-8") as f:
+        json.dump(
+            {"users": users, "lessons": lesson_refs, "question_ids": question_ids}, f
+        )
+    print(
+        f"Generated {len(bank)} questions, {len(lesson_refs)} lessons "
+        f"and {users} users in {out}"
+    )
+
+
+def make_request(scenario, rng, meta):
+    """Return ``(method, url, json_body, headers)`` for one request."""
+    headers = {"X-CPA-Visitor": f"bench_{rng.randrange(max(1, meta['users']))}"}
+    chapter_id, lesson_id = rng.choice(meta["lessons"])
+    if scenario == "lesson":
+        return "GET", f"/api/chapters/{chapter_id}/lessons/{lesson_id}", None, None
+    if scenario == "questions":
+        return "GET", f"/api/questions?chapter_id={chapter_id}", None, headers
+    if scenario == "answer":
+        body = {
+            "question_id": rng.choice(meta["question_ids"]),
+            "is_correct": rng.random() < 0.7,
+        }
+        return "POST", "/api/user/answer", body, headers
+    body = {"lesson_id": lesson_id, "score": rng.choice((60, 80, 100)), "xp_earned": 20}
+    return "POST", "/api/user/lesson/complete", body, headers
+
+
+def rss_bytes(pid=None):
+    """Current resident set size from /proc, or None where unavailable."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+async def drive(client, scenario, meta, total, concurrency, seed, pid):
+    rng = random.Random(f"{seed}:{scenario}")
+    requests = [make_request(scenario, rng, meta) for _ in range(total)]
+    latencies = []
+    errors = 0
+    cursor = 0
+
+    async def worker():
+        nonlocal cursor, errors
+        while cursor < len(requests):
+            method, url, body, headers = requests[cursor]
+            cursor += 1
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    rss_before = rss_bytes(pid)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes(pid)
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "rss_mb": round(rss_after / 2**20, 1) if rss_after else None,
+        "rss_growth_mb": (
+            round((rss_after - rss_before) / 2**20, 1)
+            if rss_before and rss_after
+            else None
+        ),
+    }
+
+
+async def run_in_process(data_dir, args, meta):
+    import httpx
+
+    os.environ["DATA_DIR"] = str(data_dir)
+    import main
+
+    results = []
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for scenario in args.scenarios:
+                results.append(
+                    await drive(
+                        client,
+                        scenario,
+                        meta,
+                        args.requests,
+                        args.concurrency,
+                        args.seed,
+                        None,
+                    )
+                )
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_uvicorn(data_dir, args, meta):
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, DATA_DIR=str(data_dir))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise SystemExit("uvicorn did not start")
+                await asyncio.sleep(0.2)
+            for scenario in args.scenarios:
+                results.append(
+                    await drive(
+                        client,
+                        scenario,
+                        meta,
+                        args.requests,
+                        args.concurrency,
+                        args.seed,
+                        server.pid,
+                    )
+                )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+
+def print_results(mode, results):
+    print(f"\n{mode}")
+    print(
+        f"  {'scenario':<16}{'req':>7}{'err':>6}{'req/s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'rss MB':>9}{'+rss MB':>9}"
+    )
+    for r in results:
+        print(
+            f"  {r['scenario']:<16}{r['requests']:>7}{r['errors']:>6}"
+            f"{r['req_per_s']:>10}"
+            f"{r['p50_ms']:>10}{r['p99_ms']:>10}{str(r['rss_mb']):>9}"
+            f"{str(r['rss_growth_mb']):>9}"
+        )
+
+
+def run(args):
+    with open(Path(args.data) / META_FILE, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "args": vars(args),
+        "modes": {},
+    }
+    modes = ("inprocess", "uvicorn") if args.mode == "both" else (args.mode,)
+    for mode in modes:
+        # Work on a scratch copy so every run starts from the same user files.
+        scratch = Path(tempfile.mkdtemp(prefix="cpa-bench-"))
+        try:
+            data_dir = scratch / "data"
+            shutil.copytree(args.data, data_dir)
+            runner = run_in_process if mode == "inprocess" else run_uvicorn
+            results = asyncio.run(runner(data_dir, args, meta))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        report["modes"][mode] = results
+        print_results(mode, results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CPA_PATH API benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="write a synthetic DATA_DIR")
+    gen.add_argument("--out", required=True)
+    gen.add_argument("--lessons", type=int, default=8, help="lessons per chapter")
+    gen.add_argument("--questions", type=int, default=12, help="questions per lesson")
+    gen.add_argument("--users", type=int, default=1000)
+    gen.add_argument("--seed", type=int, default=1)
+
+    bench = sub.add_parser("run", help="benchmark against a generated DATA_DIR")
+    bench.add_argument("--data", required=True)
+    bench.add_argument(
+        "--mode", choices=("inprocess", "uvicorn", "both"), default="both"
+    )
+    bench.add_argument("--requests", type=int, default=2000, help="per scenario")
+    bench.add_argument("--concurrency", type=int, default=32)
+    bench.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    bench.add_argument("--seed", type=int, default=1)
+    bench.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "generate":
+        generate(args.out, args.lessons, args.questions, args.users, args.seed)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
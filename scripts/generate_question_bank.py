@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
+"""Build data/question_bank.json (and the compiled .bin) from lesson files.
+
+    --incremental  only re-read lessons whose size/mtime/hash changed since
+                   the last run (tracked in question_bank.manifest.json) and
+                   splice their questions into the existing bank
+    --jobs N       process changed chapters in a pool of N processes
+"""
+import argparse
+import hashlib
 import json
-import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from atomic_file import atomic_write  # noqa: E402
+from question_bank import write_compiled_bank  # noqa: E402
+
 DATA_DIR = Path(__file__).parent.parent / "data"
 OUTPUT_FILE = DATA_DIR / "question_bank.json"
+COMPILED_FILE = DATA_DIR / "question_bank.bin"
+MANIFEST_FILE = DATA_DIR / "question_bank.manifest.json"
+# Append-only question ID list; a question's index is the stable ordinal the
+# backend packs per-user question_states by, so never reorder or prune it.
+ORDINALS_FILE = DATA_DIR / "question_ordinals.json"
 
 
 def normalize_question_type(qtype):
@@ -47,8 +67,19 @@ def process_lesson(lesson_file):
     return questions
 
 
-def main():
-    all_questions = []
+def process_chapter(lesson_files):
+    """Process one chapter's lesson files; runs in worker processes."""
+    results = []
+    for lesson_file in lesson_files:
+        questions = process_lesson(lesson_file)
+        print(f"  - {lesson_file.name}: {len(questions)} questions")
+        results.append((lesson_file, questions))
+    return results
+
+
+def scan_lessons():
+    """All lesson files in bank order, grouped by chapter."""
+    chapters = []
 
     # Process all 30 chapters
     for chapter_num in range(1, 31):
@@ -62,11 +93,142 @@ def main():
         lesson_files = sorted(chapter_dir.glob("lesson_*.json"))
 
         print(f"Chapter {chapter_num}: Found {len(lesson_files)} lesson files")
+        chapters.append(lesson_files)
+    return chapters
+
+
+def manifest_key(lesson_file):
+    return f"{lesson_file.parent.name}/{lesson_file.name}"
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_previous_bank():
+    """Return (manifest, questions per lesson key) from the last run.
+
+    The bank is stored in manifest order, so each lesson's questions are the
+    next ``count`` entries. Anything inconsistent means a full rebuild.
+    """
+    if not MANIFEST_FILE.exists() or not OUTPUT_FILE.exists():
+        return {}, {}
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)["lessons"]
+        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+            questions = json.load(f)["questions"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring previous manifest: {e}")
+        return {}, {}
+
+    if sum(entry["count"] for entry in manifest.values()) != len(questions):
+        print("Manifest does not match question bank, rebuilding everything")
+        return {}, {}
+
+    by_lesson = {}
+    cursor = 0
+    for key, entry in manifest.items():
+        by_lesson[key] = questions[cursor : cursor + entry["count"]]
+        cursor += entry["count"]
+    return manifest, by_lesson
 
+
+def is_unchanged(lesson_file, entry):
+    if entry is None:
+        return False
+    stat = lesson_file.stat()
+    if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    return file_sha256(lesson_file) == entry["sha256"]
+
+
+def process_changed(chapters, jobs):
+    """Process lesson files (grouped by chapter) and return {path: questions}."""
+    chapters = [files for files in chapters if files]
+    if jobs > 1 and len(chapters) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = [r for chunk in pool.map(process_chapter, chapters) for r in chunk]
+    else:
+        results = [r for files in chapters for r in process_chapter(files)]
+    return dict(results)
+
+
+def update_question_ordinals(questions):
+    """Append IDs not seen before to ORDINALS_FILE; return how many."""
+    ids = []
+    if ORDINALS_FILE.exists():
+        with open(ORDINALS_FILE, "r", encoding="utf-8") as f:
+            ids = json.load(f)["ids"]
+    known = set(ids)
+    added = 0
+    for q in questions:
+        qid = q.get("id", "")
+        if qid and qid not in known:
+            known.add(qid)
+            ids.append(qid)
+            added += 1
+    if added or not ORDINALS_FILE.exists():
+        with atomic_write(ORDINALS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids}, f, ensure_ascii=False)
+    return added
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the CPA question bank")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only reprocess lessons changed since the last run",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="process chapters in parallel with this many processes",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    chapters = scan_lessons()
+
+    previous_manifest, previous_questions = {}, {}
+    if args.incremental:
+        previous_manifest, previous_questions = load_previous_bank()
+
+    changed = [
+        [
+            f
+            for f in lesson_files
+            if not is_unchanged(f, previous_manifest.get(manifest_key(f)))
+        ]
+        for lesson_files in chapters
+    ]
+    reused = sum(len(files) for files in chapters) - sum(len(f) for f in changed)
+    if args.incremental:
+        print(f"\nReprocessing {sum(len(f) for f in changed)} lessons, reusing {reused}")
+    processed = process_changed(changed, args.jobs)
+
+    all_questions = []
+    manifest = {}
+    for lesson_files in chapters:
         for lesson_file in lesson_files:
-            questions = process_lesson(lesson_file)
+            key = manifest_key(lesson_file)
+            if lesson_file in processed:
+                questions = processed[lesson_file]
+                entry = {"sha256": file_sha256(lesson_file)}
+            else:
+                questions = previous_questions[key]
+                entry = {"sha256": previous_manifest[key]["sha256"]}
+            stat = lesson_file.stat()
+            entry.update(
+                {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "count": len(questions)}
+            )
+            manifest[key] = entry
             all_questions.extend(questions)
-            print(f"  - {lesson_file.name}: {len(questions)} questions")
 
     # Create question bank
     question_bank = {
@@ -74,12 +236,25 @@ def main():
         "questions": all_questions,
     }
 
-    # Write to file
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    # Register new IDs before publishing a bank that contains them, so the
+    # registry is never behind the bank the server loads.
+    new_ordinals = update_question_ordinals(all_questions)
+
+    # Replaced atomically, so a running server reloading the bank never reads
+    # a half-written file
+    with atomic_write(OUTPUT_FILE, "w", encoding="utf-8") as f:
         json.dump(question_bank, f, ensure_ascii=False, indent=2)
 
+    # Compiled copy the backend memory-maps instead of parsing the JSON
+    write_compiled_bank(all_questions, COMPILED_FILE)
+
+    with atomic_write(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump({"lessons": manifest}, f, ensure_ascii=False)
+
     print(f"\nGenerated {OUTPUT_FILE}")
+    print(f"Generated {COMPILED_FILE}")
     print(f"Total questions: {len(all_questions)}")
+    print(f"New question ordinals: {new_ordinals}")
 
     # Print summary by chapter
     chapter_counts = {}